@@ -1,6 +1,7 @@
 from pydantic_ai import Agent
 
 from panda_brain.config import get_model
+from panda_brain.history import compact_history
 
 bilibili_agent = Agent(
     get_model(),
@@ -10,7 +11,10 @@ bilibili_agent = Agent(
         "不要猜测或编造。支持俗称（如「骨王」对应 OVERLORD）直接作为搜索词。\n"
         "返回播放链接时，必须逐条列出每一集的链接，禁止用「ep1~ep14」等范围概括。\n"
         "若需丰富某一集的资料，可用 get_top_comments(bvid) 获取高赞评论，get_danmakus(bvid) 获取弹幕，"
-        "或 analyze_danmaku_density(bvid) 根据弹幕密度分析精彩程度与剧情。\n"
+        "或 analyze_danmaku_density(bvid) 根据弹幕密度分析精彩程度与剧情；"
+        "分析整集时传 mode=\"segment\"，按剧情自然分段，速度快得多。\n"
+        "分析全片等耗时较长时，用 submit_danmaku_analysis 提交后台任务并把任务 ID 告诉用户，"
+        "不要等待；用户询问进度时用 get_job_status，完成后用 get_job_result 取结果。\n"
         "展示弹幕分析结果时：\n"
         "  - 按剧情主题将段落分组为大类，每个大类下必须列出该范围内的全部段落。\n"
         "  - 工具返回 N 段，你的输出中必须出现 N 段，严禁省略、合并或跳过。\n"
@@ -18,4 +22,5 @@ bilibili_agent = Agent(
         "  - 输出要尽可能完整，不要担心长度。\n"
         "始终用中文回答。"
     ),
+    history_processors=[compact_history],
 )
@@ -0,0 +1,77 @@
+"""高赞评论：按需并发拉取多页、合并后按点赞数排序，按 bvid 缓存（TTL）。
+
+get_top_comments 工具与弹幕分析共用，同一视频短时间内只拉取一次。
+"""
+
+import asyncio
+import math
+from functools import partial
+
+from bilibili_api import comment
+from bilibili_api.comment import CommentResourceType, OrderType
+from bilibili_api.utils.aid_bvid_transformer import bvid2aid
+
+from panda_brain.agents.bilibili import gateway
+from panda_brain.cache import LRUCache
+from panda_brain.config import settings
+
+# 评论接口每页条数
+PAGE_SIZE = 20
+
+# bvid → {"pages": 已拉页数, "exhausted": 是否已无更多, "items": [{"text", "like"}]}
+_cache = LRUCache(256, ttl_sec=settings.comment_cache_ttl_sec)
+
+
+async def _fetch_page(aid: int, page: int) -> list[dict]:
+    result = await gateway.call("comment.list", partial(
+        comment.get_comments,
+        oid=aid,
+        type_=CommentResourceType.VIDEO,
+        page_index=page,
+        order=OrderType.LIKE,
+        credential=gateway.get_credential(),
+    ))
+    return result.get("replies") or []
+
+
+async def fetch_top_comments(bvid: str, top_n: int = 10) -> list[dict]:
+    """点赞最多的前 top_n 条评论 [{"text", "like"}]，文本未截断。
+
+    第 1 页失败时抛出异常；后续某页失败时只采用它之前连续成功的各页，缓存也只记这些页，
+    之后的调用会重新拉取缺失的页。
+    """
+    pages = max(1, math.ceil(top_n / PAGE_SIZE))
+    cached = _cache.get(bvid)
+    if cached is not None and (cached["pages"] >= pages or cached["exhausted"]):
+        return cached["items"][:top_n]
+
+    aid = bvid2aid(bvid)
+    results = await asyncio.gather(
+        *(_fetch_page(aid, p) for p in range(1, pages + 1)),
+        return_exceptions=True,
+    )
+    if isinstance(results[0], BaseException):
+        raise results[0]
+
+    seen: set[int] = set()
+    items: list[dict] = []
+    exhausted = False
+    fetched = 0
+    for replies in results:
+        if isinstance(replies, BaseException):
+            break
+        fetched += 1
+        for r in replies:
+            rpid = r.get("rpid")
+            msg = (r.get("content") or {}).get("message", "").strip()
+            if not msg or rpid in seen:
+                continue
+            seen.add(rpid)
+            items.append({"text": msg, "like": r.get("like", 0)})
+        if len(replies) < PAGE_SIZE:
+            exhausted = True
+            break
+    # 各页之间点赞数可能交错（翻页期间有新点赞），合并后统一排序
+    items.sort(key=lambda c: -c["like"])
+    _cache.set(bvid, {"pages": fetched, "exhausted": exhausted, "items": items})
+    return items[:top_n]
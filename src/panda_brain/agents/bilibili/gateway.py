@@ -0,0 +1,174 @@
+"""B 站接口统一出口：所有 bilibili 工具的请求都经 call() 发出。
+
+- 进程内共享同一个 Credential（BILIBILI_SESSDATA）
+- 令牌桶限制请求速率，信号量限制同时在途的请求数
+- 遇到限流（HTTP 412/429、code -352/-412/-509）时全局冷却、速率减半，之后逐步恢复；
+  网络错误与 5xx 按指数退避重试，其余错误直接抛出
+- 按接口名统计调用次数、错误 / 限流次数与耗时，stats() 查看
+"""
+
+import asyncio
+import os
+import random
+import time
+from collections.abc import Awaitable, Callable
+from dataclasses import dataclass
+from typing import TypeVar
+
+import httpx
+from bilibili_api import Credential
+from bilibili_api.exceptions import NetworkException, ResponseCodeException
+
+from panda_brain.config import settings
+
+T = TypeVar("T")
+
+_THROTTLE_CODES = {-352, -412, -509}
+_THROTTLE_STATUS = {412, 429}
+# 限流后速率下限（请求/秒）与每次成功后的恢复倍数
+_MIN_RATE = 0.5
+_RECOVER = 1.1
+
+_credential: Credential | None = None
+
+
+def get_credential() -> Credential:
+    """共享 Credential：首次调用时按 BILIBILI_SESSDATA 创建。"""
+    global _credential
+    if _credential is None:
+        sessdata = os.environ.get("BILIBILI_SESSDATA", "")
+        _credential = Credential(sessdata=sessdata) if sessdata else Credential()
+    return _credential
+
+
+class TokenBucket:
+    """令牌桶：每秒补充 rate 个令牌，最多积攒 burst 个；acquire 取一个，不足时等待。"""
+
+    def __init__(self, rate: float, burst: int):
+        self.rate = rate
+        self.burst = max(1, burst)
+        self.tokens = float(self.burst)
+        self._updated = time.monotonic()
+        self._lock = asyncio.Lock()
+
+    async def acquire(self) -> None:
+        async with self._lock:
+            while True:
+                now = time.monotonic()
+                self.tokens = min(self.burst, self.tokens + (now - self._updated) * self.rate)
+                self._updated = now
+                if self.tokens >= 1:
+                    self.tokens -= 1
+                    return
+                await asyncio.sleep((1 - self.tokens) / self.rate)
+
+
+@dataclass
+class EndpointStats:
+    calls: int = 0
+    errors: int = 0
+    throttled: int = 0
+    total_sec: float = 0.0
+    max_sec: float = 0.0
+
+    def record(self, elapsed: float) -> None:
+        self.calls += 1
+        self.total_sec += elapsed
+        self.max_sec = max(self.max_sec, elapsed)
+
+    def to_dict(self) -> dict:
+        return {
+            "calls": self.calls,
+            "errors": self.errors,
+            "throttled": self.throttled,
+            "avg_ms": round(self.total_sec / self.calls * 1000, 1) if self.calls else 0.0,
+            "max_ms": round(self.max_sec * 1000, 1),
+        }
+
+
+_bucket = TokenBucket(settings.bilibili_rate_per_sec, settings.bilibili_burst)
+_semaphore: asyncio.Semaphore | None = None
+_stats: dict[str, EndpointStats] = {}
+_cooldown_until = 0.0
+_throttle_streak = 0
+
+
+def _is_throttled(e: Exception) -> bool:
+    if isinstance(e, ResponseCodeException):
+        return e.code in _THROTTLE_CODES
+    if isinstance(e, NetworkException):
+        return e.status in _THROTTLE_STATUS
+    return False
+
+
+def _is_transient(e: Exception) -> bool:
+    if isinstance(e, NetworkException):
+        return e.status >= 500
+    return isinstance(e, (httpx.TransportError, asyncio.TimeoutError))
+
+
+def _on_throttled() -> None:
+    """限流：速率减半并设置全局冷却，连续限流时冷却时间翻倍。"""
+    global _cooldown_until, _throttle_streak
+    _throttle_streak += 1
+    _bucket.rate = max(_MIN_RATE, _bucket.rate / 2)
+    delay = min(60.0, 2.0 * 2 ** (_throttle_streak - 1)) + random.uniform(0, 0.5)
+    _cooldown_until = max(_cooldown_until, time.monotonic() + delay)
+
+
+def _on_success() -> None:
+    global _throttle_streak
+    _throttle_streak = 0
+    if _bucket.rate < settings.bilibili_rate_per_sec:
+        _bucket.rate = min(settings.bilibili_rate_per_sec, _bucket.rate * _RECOVER)
+
+
+async def call(
+    endpoint: str,
+    factory: Callable[[], Awaitable[T]],
+    retries: int | None = None,
+) -> T:
+    """经限流发出一次请求，endpoint 为统计用的接口名（如 "video.info"）。
+
+    factory 每次重试都会重新调用；retries 默认取 PANDA_BILIBILI_RETRIES。
+    """
+    global _semaphore
+    if _semaphore is None:
+        _semaphore = asyncio.Semaphore(max(1, settings.bilibili_max_concurrency))
+    st = _stats.setdefault(endpoint, EndpointStats())
+    retries = settings.bilibili_retries if retries is None else max(0, retries)
+    for attempt in range(retries + 1):
+        wait = _cooldown_until - time.monotonic()
+        if wait > 0:
+            await asyncio.sleep(wait)
+        await _bucket.acquire()
+        async with _semaphore:
+            started = time.monotonic()
+            try:
+                result = await factory()
+            except Exception as e:
+                st.record(time.monotonic() - started)
+                st.errors += 1
+                throttled = _is_throttled(e)
+                if throttled:
+                    st.throttled += 1
+                    _on_throttled()
+                if attempt == retries or not (throttled or _is_transient(e)):
+                    raise
+                if throttled:
+                    continue  # 下一轮先等全局冷却
+                delay = 0.5 * 2 ** attempt + random.uniform(0, 0.25)
+            else:
+                st.record(time.monotonic() - started)
+                _on_success()
+                return result
+        await asyncio.sleep(delay)
+    raise RuntimeError("unreachable")
+
+
+def stats() -> dict:
+    """各接口的调用统计，以及当前限流速率（请求/秒，限流后会暂时低于配置值）。"""
+    return {
+        "rate_per_sec": round(_bucket.rate, 2),
+        "endpoints": {name: st.to_dict() for name, st in sorted(_stats.items())},
+    }
@@ -10,6 +10,9 @@ import asyncio
 from pydantic_ai.messages import ModelMessage
 
 from panda_brain.agents.bilibili import bilibili_agent
+from panda_brain import streaming
+from panda_brain.config import aclose_http_client
+from panda_brain.jobs import get_queue
 
 
 async def main():
@@ -17,26 +20,39 @@ async def main():
     print("输入 'quit' 或 'exit' 退出\n")
 
     message_history: list[ModelMessage] = []
-
-    while True:
-        try:
-            user_input = input("你: ").strip()
-        except (KeyboardInterrupt, EOFError):
-            print("\n再见!")
-            break
-
-        if not user_input:
-            continue
-        if user_input.lower() in ("quit", "exit"):
-            print("再见!")
-            break
-
-        try:
-            result = await bilibili_agent.run(user_input, message_history=message_history)
-            print(f"\nB站: {result.output}\n")
-            message_history = result.all_messages()
-        except Exception as e:
-            print(f"\n错误: {e}\n")
+    # 导入时不在事件循环中，上次退出时中断的后台任务在这里重新启动
+    get_queue().resume()
+
+    try:
+        while True:
+            try:
+                user_input = input("你: ").strip()
+            except (KeyboardInterrupt, EOFError):
+                print("\n再见!")
+                break
+
+            if not user_input:
+                continue
+            if user_input.lower() in ("quit", "exit"):
+                print("再见!")
+                break
+
+            streaming.begin_stream("B站: ")
+            try:
+                result = await bilibili_agent.run(
+                    user_input,
+                    message_history=message_history,
+                    event_stream_handler=streaming.print_stream,
+                )
+                if not streaming.end_stream():
+                    print(result.output)
+                print()
+                message_history = result.all_messages()
+            except Exception as e:
+                streaming.end_stream()
+                print(f"\n错误: {e}\n")
+    finally:
+        await aclose_http_client()
 
 
 def run():
@@ -9,12 +9,16 @@ import asyncio
 import sys
 
 from panda_brain.agents.bilibili.tools.danmaku.tools import analyze_danmaku_density
+from panda_brain.config import aclose_http_client
 
 
 async def main(bvid: str, max_minutes: float | None = None) -> None:
     print(f"分析 {bvid}，输出完整结果…\n")
     max_sec = int(max_minutes * 60) if max_minutes else None
-    full = await analyze_danmaku_density(bvid, max_duration_sec=max_sec)
+    try:
+        full = await analyze_danmaku_density(bvid, max_duration_sec=max_sec)
+    finally:
+        await aclose_http_client()
     print(full)
 
 
@@ -0,0 +1,48 @@
+"""
+核对 NumPy 密度引擎与 density.py 参考实现的结果一致（含只有 1~2 个点的短曲线）。
+
+用法:
+    PYTHONPATH=src python -m panda_brain.agents.bilibili.test_density_np
+    或 pytest src/panda_brain/agents/bilibili/test_density_np.py
+"""
+import random
+
+from panda_brain.agents.bilibili.tools.danmaku._internal import density, density_np
+from panda_brain.agents.bilibili.tools.danmaku._internal.index import DanmakuIndex
+from panda_brain.agents.bilibili.tools.danmaku._internal.segment import select_boundaries
+
+
+def test_smooth_matches_reference() -> None:
+    rng = random.Random(0)
+    for n in (0, 1, 2, 3, 4, 10):
+        values = [float(rng.randint(0, 50)) for _ in range(n)]
+        for window in (1, 3, 5):
+            got = density_np.smooth(values, window).tolist()
+            want = density.smooth(values, window)
+            assert len(got) == n, (n, window, got)
+            assert all(abs(a - b) < 1e-9 for a, b in zip(got, want)), (n, window, got, want)
+
+
+def test_collect_minima_matches_reference() -> None:
+    rng = random.Random(1)
+    for n in (1, 2, 3, 8, 40):
+        smoothed = density.smooth([float(rng.randint(0, 50)) for _ in range(n)])
+        got = density_np.collect_minima(smoothed)
+        want = density.collect_minima(smoothed)
+        assert [i for i, _ in got] == [i for i, _ in want], (n, got, want)
+        assert all(abs(a - b) < 1e-9 for (_, a), (_, b) in zip(got, want))
+
+
+def test_short_video_segments() -> None:
+    """窗口比视频还长时曲线只有 1 个点，不应切分也不应越界。"""
+    index = DanmakuIndex((t, "弹幕") for t in range(0, 500, 7))
+    positions, _, smoothed = density_np.density_curve(index, 500, 600, 600)
+    assert len(smoothed) == len(positions) == 1
+    assert select_boundaries(smoothed, positions, 500, 600, 300, 60, index) == []
+
+
+if __name__ == "__main__":
+    test_smooth_matches_reference()
+    test_collect_minima_matches_reference()
+    test_short_video_segments()
+    print("ok")
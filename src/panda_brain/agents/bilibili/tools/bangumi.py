@@ -1,13 +1,79 @@
-import os
+import asyncio
 
 from bilibili_api import Credential, bangumi
 
+from panda_brain.agents.bilibili import gateway
 from panda_brain.agents.bilibili.agent import bilibili_agent
+from panda_brain.cache import DiskCache
+from panda_brain.config import settings
 
+# 已完结季度的分集列表与 epid→bvid 几乎不变，长期缓存
+_cache = DiskCache(
+    "bangumi",
+    ttl_sec=settings.bangumi_cache_ttl_sec,
+    max_bytes=16 * 1024 * 1024,
+)
+# 连载中的季度每周更新，分集列表只短期缓存
+_airing_cache = DiskCache(
+    "bangumi_airing",
+    ttl_sec=settings.bangumi_airing_cache_ttl_sec,
+    max_bytes=4 * 1024 * 1024,
+)
 
-def _get_credential() -> Credential:
-    sessdata = os.environ.get("BILIBILI_SESSDATA", "")
-    return Credential(sessdata=sessdata) if sessdata else Credential()
+
+async def _season_finished(b: bangumi.Bangumi) -> bool:
+    """季度是否已完结；查询失败时按连载中处理。"""
+    try:
+        overview = await gateway.call("bangumi.overview", b.get_overview)
+    except Exception:
+        return False
+    return bool((overview.get("publish") or {}).get("is_finish"))
+
+
+async def _season_episodes(sid: int, cred: Credential) -> list[dict]:
+    """季度正片分集：[{id, title, bvid}]，bvid 可能为空。
+
+    已完结的季度长期缓存，连载中的季度只缓存 PANDA_BANGUMI_AIRING_CACHE_TTL_SEC 秒，
+    以便新更新的集数及时出现。
+    """
+    key = f"season:{sid}"
+    for cache in (_cache, _airing_cache):
+        cached = cache.get(key)
+        if cached is not None:
+            return cached
+    b = bangumi.Bangumi(ssid=sid, credential=cred)
+    ep_data, finished = await asyncio.gather(
+        gateway.call("bangumi.episode_list", b.get_episode_list),
+        _season_finished(b),
+    )
+    episodes = [
+        {
+            "id": ep["id"],
+            "title": ep.get("share_copy") or ep.get("long_title") or ep.get("title", "未知"),
+            "bvid": ep.get("bvid") or "",
+        }
+        for ep in ep_data.get("main_section", {}).get("episodes", [])
+    ]
+    if episodes:
+        (_cache if finished else _airing_cache).set(key, episodes)
+    return episodes
+
+
+async def _episode_bvid(epid: int, cred: Credential) -> str:
+    """单集 epid 解析为 bvid，失败返回空字符串。"""
+    key = f"ep:{epid}"
+    cached = _cache.get(key)
+    if cached is not None:
+        return cached
+    try:
+        bvid = await gateway.call(
+            "bangumi.episode_bvid", bangumi.Episode(epid=epid, credential=cred).get_bvid,
+        )
+    except Exception:
+        return ""
+    if bvid:
+        _cache.set(key, bvid)
+    return bvid or ""
 
 
 @bilibili_agent.tool_plain
@@ -15,39 +81,38 @@ async def get_bangumi_playback_links(ssid: int | None = None, media_id: int | No
     """获取番剧各集的 B 站网页播放链接。传入 ssid（season_id，推荐）或 media_id 之一。返回每集的标题、BVID 和播放链接。"""
     if ssid is None and media_id is None:
         return "错误：请提供 ssid 或 media_id 之一。"
-    cred = _get_credential()
+    cred = gateway.get_credential()
     lines: list[str] = []
     try:
         if ssid is not None:
             seasons = [{"season_id": ssid, "season_title": f"季{ssid}"}]
         else:
             m = bangumi.Bangumi(media_id=media_id, credential=cred)
-            info = await m.get_meta()
+            info = await gateway.call("bangumi.meta", m.get_meta)
             media_info = info.get("media", {})
             title = media_info.get("title", "未知")
             seasons = media_info.get("seasons", [])
             if not seasons:
-                seasons = [{"season_id": await m.get_season_id(), "season_title": title}]
+                sid = await gateway.call("bangumi.season_id", m.get_season_id)
+                seasons = [{"season_id": sid, "season_title": title}]
+
+        # 各季分集列表并发获取，缺 bvid 的单集再统一并发解析（并发与速率由网关限制）
+        season_eps = await asyncio.gather(
+            *(_season_episodes(s_info["season_id"], cred) for s_info in seasons)
+        )
+        missing = [ep for eps in season_eps for ep in eps if not ep["bvid"]]
+        bvids = await asyncio.gather(*(_episode_bvid(ep["id"], cred) for ep in missing))
+        resolved = {ep["id"]: bvid for ep, bvid in zip(missing, bvids)}
 
-        for s_info in seasons:
+        for s_info, episodes in zip(seasons, season_eps):
             sid = s_info["season_id"]
             s_title = s_info.get("season_title") or s_info.get("title", f"第{sid}季")
             lines.append(f"\n--- {s_title} (ID: {sid}) ---")
-
-            s = bangumi.Bangumi(ssid=sid, credential=cred)
-            ep_data = await s.get_episode_list()
-            episodes = ep_data.get("main_section", {}).get("episodes", [])
-
             for ep in episodes:
-                ep_title = ep.get("share_copy") or ep.get("long_title") or ep.get("title", "未知")
                 epid = ep["id"]
                 play_url = f"https://www.bilibili.com/bangumi/play/ep{epid}"
-                bvid = ep.get("bvid")
-                if not bvid:
-                    episode_obj = bangumi.Episode(epid=epid, credential=cred)
-                    bvid = await episode_obj.get_bvid()
-                bvid = bvid or ""
-                lines.append(f"集数: {ep_title}\nBVID: {bvid}\n播放链接: {play_url}")
+                bvid = ep["bvid"] or resolved.get(epid, "")
+                lines.append(f"集数: {ep['title']}\nBVID: {bvid}\n播放链接: {play_url}")
 
         return "🎬 番剧播放链接:\n" + "\n".join(lines) if lines else "未找到剧集。"
     except Exception as e:
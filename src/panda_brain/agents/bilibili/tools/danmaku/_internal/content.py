@@ -1,5 +1,7 @@
 """基于弹幕内容的话题变化检测。"""
 
+from panda_brain.agents.bilibili.tools.danmaku._internal.index import DanmakuIndex
+
 
 def text_bigrams(texts: list[str]) -> set[str]:
     """提取文本列表的字符 bigram 集合。"""
@@ -19,8 +21,7 @@ def jaccard(a: set[str], b: set[str]) -> float:
 
 
 def content_split_point(
-    buckets: dict[int, list[str]],
-    bucket_sec: int,
+    index: DanmakuIndex,
     seg_start: int,
     seg_end: int,
     min_margin: int,
@@ -34,10 +35,7 @@ def content_split_point(
     windows: list[tuple[int, set[str]]] = []
     for start in range(seg_start, seg_end, analysis_window):
         end = min(start + analysis_window, seg_end)
-        texts: list[str] = []
-        for t in range(start, end, bucket_sec):
-            texts.extend(buckets.get(t, []))
-        grams = text_bigrams(texts)
+        grams = text_bigrams(index.texts_between(start, end))
         windows.append((start, grams))
 
     if len(windows) < 3:
@@ -1,5 +1,7 @@
 """滑动窗口密度曲线计算 & 局部最小值检测。"""
 
+from panda_brain.agents.bilibili.tools.danmaku._internal.index import DanmakuIndex
+
 
 def smooth(values: list[float], window: int = 3) -> list[float]:
     """滑动平均平滑。"""
@@ -15,18 +17,18 @@ def smooth(values: list[float], window: int = 3) -> list[float]:
 
 
 def sliding_density(
-    buckets: dict[int, list[str]],
-    bucket_sec: int,
+    index: DanmakuIndex,
     duration: int,
     window_sec: int,
     step_sec: int,
 ) -> tuple[list[int], list[float]]:
-    """滑动窗口计算密度曲线，重叠部分交叉观察。"""
+    """滑动窗口计算密度曲线，重叠部分交叉观察。每个窗口计数为一次二分查询。"""
     positions: list[int] = []
     densities: list[float] = []
     for start in range(0, duration, step_sec):
-        end = min(start + window_sec, duration + bucket_sec)
-        count = sum(len(buckets.get(t, [])) for t in range(start, end, bucket_sec))
+        # 最后一个窗口包含恰好落在 duration 这一秒的弹幕
+        end = min(start + window_sec, duration + 1)
+        count = index.count(start, end)
         positions.append(start)
         densities.append(float(count))
     return positions, densities
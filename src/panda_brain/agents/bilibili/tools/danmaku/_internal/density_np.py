@@ -0,0 +1,89 @@
+"""密度曲线的 NumPy 实现：计数数组 + 前缀和窗口、卷积平滑、向量化局部最小值检测。
+
+与 density.py 中的列表实现结果一致（bucket_sec=1 时逐项相等），density.py 保留作参考实现。
+"""
+
+import numpy as np
+from numpy.lib.stride_tricks import sliding_window_view
+
+from panda_brain.agents.bilibili.tools.danmaku._internal.index import DanmakuIndex
+
+# 局部最小值两侧找峰值的范围（点数），与 density.collect_minima 一致
+_PEAK_SPAN = 5
+
+
+def bucket_counts(index: DanmakuIndex, duration: int, bucket_sec: int = 1) -> np.ndarray:
+    """按 bucket_sec 分桶统计弹幕数，覆盖 [0, duration]，超出范围的弹幕丢弃。"""
+    n = duration // bucket_sec + 1
+    if not len(index):
+        return np.zeros(n, dtype=np.int64)
+    buckets = (np.asarray(index.times) // bucket_sec).astype(np.int64)
+    buckets = buckets[(buckets >= 0) & (buckets < n)]
+    return np.bincount(buckets, minlength=n)
+
+
+def sliding_density(
+    counts: np.ndarray,
+    bucket_sec: int,
+    duration: int,
+    window_sec: int,
+    step_sec: int,
+) -> tuple[np.ndarray, np.ndarray]:
+    """前缀和计算滑动窗口密度：每个窗口 O(1)。"""
+    prefix = np.concatenate(([0], np.cumsum(counts)))
+    positions = np.arange(0, duration, step_sec)
+    ends = np.minimum(positions + window_sec, duration + 1)
+    lo = np.clip(positions // bucket_sec, 0, len(counts))
+    hi = np.clip(-(-ends // bucket_sec), 0, len(counts))
+    return positions, (prefix[hi] - prefix[lo]).astype(np.float64)
+
+
+def smooth(values: np.ndarray, window: int = 3) -> np.ndarray:
+    """居中滑动平均（卷积实现），边缘按实际覆盖点数取平均。"""
+    values = np.asarray(values, dtype=np.float64)
+    n = len(values)
+    if n == 0:
+        return values
+    half = window // 2
+    kernel = np.ones(2 * half + 1)
+    # mode="same" 在 n 小于核长时返回 len(kernel) 个点，改用 full 再截回 n 个
+    sums = np.convolve(values, kernel, mode="full")[half: half + n]
+    sizes = np.convolve(np.ones(n), kernel, mode="full")[half: half + n]
+    return sums / sizes
+
+
+def collect_minima(smoothed: np.ndarray) -> list[tuple[int, float]]:
+    """找所有局部最小值及其相对深度，按深度降序排列（同深度保持位置顺序）。"""
+    s = np.asarray(smoothed, dtype=np.float64)
+    n = len(s)
+    if n <= 2:
+        return []
+    pad = np.full(_PEAK_SPAN, -np.inf)
+    # left_peak[i] = max(s[i-5:i])，right_peak[i] = max(s[i+1:i+6])
+    left_peak = sliding_window_view(np.concatenate((pad, s)), _PEAK_SPAN).max(axis=1)[:n]
+    right_peak = sliding_window_view(np.concatenate((s[1:], pad)), _PEAK_SPAN).max(axis=1)[:n]
+
+    mid = s[1:-1]
+    is_min = (mid <= s[:-2]) & (mid <= s[2:])
+    idx = np.nonzero(is_min)[0] + 1
+    if not len(idx):
+        return []
+    peak = np.maximum(np.maximum(left_peak[idx], right_peak[idx]), 1e-9)
+    depth = 1.0 - s[idx] / peak
+    order = np.argsort(-depth, kind="stable")
+    return [(int(i), float(d)) for i, d in zip(idx[order], depth[order])]
+
+
+def density_curve(
+    index: DanmakuIndex,
+    duration: int,
+    window_sec: int,
+    step_sec: int,
+    bucket_sec: int = 1,
+    smooth_window: int = 3,
+) -> tuple[list[int], list[float], list[float]]:
+    """一次算出 (窗口起点, 原始密度, 平滑密度)，供 segment.select_boundaries 使用。"""
+    counts = bucket_counts(index, duration, bucket_sec)
+    positions, densities = sliding_density(counts, bucket_sec, duration, window_sec, step_sec)
+    smoothed = smooth(densities, smooth_window)
+    return positions.tolist(), densities.tolist(), smoothed.tolist()
@@ -0,0 +1,128 @@
+"""弹幕分段拉取：B 站按 6 分钟一段下发弹幕，每段按 (bvid, 分P, 段号) 缓存到本地磁盘。
+
+各段有界并发拉取，经 B 站网关限流与退避重试；DanmakuFeed 在后台按段顺序扩充时间索引，
+分析可以在后面的段还在下载时先处理前面的窗口。
+"""
+
+import asyncio
+import math
+from collections.abc import AsyncIterator
+from functools import partial
+
+from bilibili_api import video
+
+from panda_brain.agents.bilibili import gateway
+from panda_brain.agents.bilibili.tools.danmaku._internal.index import DanmakuIndex
+from panda_brain.agents.bilibili.tools.danmaku._internal.scheduler import ordered_map
+from panda_brain.cache import DiskCache
+from panda_brain.config import settings
+
+# 一段弹幕覆盖的秒数
+SEGMENT_SEC = 360
+
+_cache = DiskCache(
+    "danmaku",
+    ttl_sec=settings.danmaku_cache_ttl_sec,
+    max_bytes=settings.danmaku_cache_max_mb * 1024 * 1024,
+)
+
+
+async def fetch_segment(
+    v: video.Video, bvid: str, page_index: int, seg: int,
+) -> list[tuple[float, str]]:
+    """拉取单段弹幕，返回 (出现时间秒, 原始文本) 列表；命中缓存时不发请求。"""
+    key = f"{bvid}:{page_index}:{seg}"
+    if settings.danmaku_cache_enabled:
+        cached = _cache.get(key)
+        if cached is not None:
+            return list(zip(cached["t"], cached["s"]))
+    danmakus = await gateway.call(
+        "danmaku.segment",
+        partial(v.get_danmakus, page_index=page_index, from_seg=seg, to_seg=seg),
+        retries=settings.danmaku_fetch_retries,
+    )
+    times = [dm.dm_time for dm in danmakus]
+    texts = [dm.text for dm in danmakus]
+    if settings.danmaku_cache_enabled:
+        # 列式存储（时间数组 + 文本数组），比逐条对象紧凑得多
+        _cache.set(key, {"t": times, "s": texts})
+    return list(zip(times, texts))
+
+
+async def iter_segments(
+    bvid: str, from_seg: int, to_seg: int, page_index: int = 0,
+) -> AsyncIterator[tuple[int, list[tuple[float, str]]]]:
+    """并发拉取 from_seg..to_seg（含）各段，按段号顺序产出 (段号, 记录)。
+
+    并发数由 PANDA_DANMAKU_FETCH_CONCURRENCY 控制。
+    """
+    v = video.Video(bvid=bvid, credential=gateway.get_credential())
+    segs = list(range(from_seg, to_seg + 1))
+    results = ordered_map(
+        [partial(fetch_segment, v, bvid, page_index, seg) for seg in segs],
+        settings.danmaku_fetch_concurrency,
+    )
+    try:
+        async for i, records in results:
+            yield segs[i], records
+    finally:
+        await results.aclose()
+
+
+async def fetch_danmaku_records(
+    bvid: str, from_seg: int, to_seg: int, page_index: int = 0,
+) -> list[tuple[float, str]]:
+    """拉取 from_seg..to_seg（含）各段弹幕并拼接。"""
+    records: list[tuple[float, str]] = []
+    async for _, seg_records in iter_segments(bvid, from_seg, to_seg, page_index):
+        records.extend(seg_records)
+    return records
+
+
+class DanmakuFeed:
+    """后台按段顺序拉取弹幕并扩充 index；wait_until(sec) 等到 [0, sec) 的弹幕全部到齐。
+
+    拉取失败时，等待中的和之后的 wait_until 都会抛出该异常。
+    """
+
+    def __init__(self, bvid: str, to_seg: int, page_index: int = 0):
+        self.index = DanmakuIndex()
+        self.covered_sec: float = 0
+        self._changed = asyncio.Condition()
+        self._error: BaseException | None = None
+        self._task = asyncio.ensure_future(self._run(bvid, to_seg, page_index))
+
+    async def _run(self, bvid: str, to_seg: int, page_index: int) -> None:
+        try:
+            async for seg, records in iter_segments(bvid, 0, to_seg, page_index):
+                self.index.extend(records)
+                await self._set_covered((seg + 1) * SEGMENT_SEC)
+            await self._set_covered(math.inf)
+        except asyncio.CancelledError:
+            raise
+        except Exception as e:
+            self._error = e
+            await self._set_covered(self.covered_sec)
+
+    async def _set_covered(self, sec: float) -> None:
+        async with self._changed:
+            self.covered_sec = sec
+            self._changed.notify_all()
+
+    @property
+    def done(self) -> bool:
+        return self._task.done()
+
+    async def wait_until(self, sec: float) -> None:
+        async with self._changed:
+            await self._changed.wait_for(
+                lambda: self.covered_sec >= sec or self._error is not None or self._task.done()
+            )
+        if self._error is not None:
+            raise self._error
+
+    async def wait_all(self) -> None:
+        await self.wait_until(math.inf)
+
+    def cancel(self) -> None:
+        self._task.cancel()
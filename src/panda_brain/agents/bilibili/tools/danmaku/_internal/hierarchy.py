@@ -0,0 +1,90 @@
+"""层级 map-reduce 概括树：叶子块各概括一次，上层节点由相邻下层节点的概括合并而来。
+
+叶子之外的每一层只处理下层的一句话概括，总输入量与弹幕量成线性关系，
+与滑动窗口的重叠倍数无关。
+"""
+
+from collections.abc import Awaitable, Callable
+from dataclasses import dataclass, field
+from functools import partial
+
+from panda_brain.agents.bilibili.tools.danmaku._internal.scheduler import ordered_map
+from panda_brain.agents.bilibili.tools.danmaku._internal.utils import fmt_ts
+
+# merge(若干句概括, 起点秒, 终点秒) -> 合并后的一句话
+Merge = Callable[[list[str], int, int], Awaitable[str]]
+
+
+@dataclass
+class SummaryNode:
+    start_sec: int
+    end_sec: int
+    summary: str
+    children: list["SummaryNode"] = field(default_factory=list)
+
+    def to_dict(self) -> dict:
+        return {
+            "start_sec": self.start_sec,
+            "end_sec": self.end_sec,
+            "start_ts": fmt_ts(self.start_sec),
+            "end_ts": fmt_ts(self.end_sec),
+            "summary": self.summary,
+        }
+
+
+async def merge_nodes(nodes: list[SummaryNode], merge: Merge) -> SummaryNode:
+    """合并相邻节点；只有一句非空概括时直接沿用，不调用 LLM。"""
+    texts = [n.summary for n in nodes if n.summary]
+    start, end = nodes[0].start_sec, nodes[-1].end_sec
+    if not texts:
+        summary = ""
+    elif len(texts) == 1:
+        summary = texts[0]
+    else:
+        summary = await merge(texts, start, end)
+    return SummaryNode(start, end, summary, list(nodes))
+
+
+async def _merge_all(
+    groups: list[list[SummaryNode]],
+    merge: Merge,
+    limit: int,
+    on_done: Callable[[int, SummaryNode], None] | None,
+) -> list[SummaryNode]:
+    factories = [partial(merge_nodes, g, merge) for g in groups]
+    return [node async for _, node in ordered_map(factories, limit, on_done=on_done)]
+
+
+async def sliding_merge(
+    nodes: list[SummaryNode],
+    width: int,
+    merge: Merge,
+    limit: int,
+    on_done: Callable[[int, SummaryNode], None] | None = None,
+) -> list[SummaryNode]:
+    """重叠窗口：第 i 个窗口由 nodes[i:i+width] 合并而来，每个叶子只被概括过一次。"""
+    groups = [nodes[i: i + width] for i in range(len(nodes))]
+    return await _merge_all(groups, merge, limit, on_done)
+
+
+async def build_tree(
+    leaves: list[SummaryNode],
+    fanouts: list[int],
+    merge: Merge,
+    limit: int,
+    on_done: Callable[[int, SummaryNode], None] | None = None,
+) -> list[list[SummaryNode]]:
+    """自底向上建树：第 k 层把上一层每 fanouts[k] 个相邻节点合并为一个，最后合并为单一根节点。
+
+    返回各层节点列表，levels[0] 为叶子，levels[-1] 为只含根节点的列表。
+    """
+    levels = [leaves]
+    for fanout in fanouts:
+        if len(levels[-1]) <= 1:
+            break
+        prev = levels[-1]
+        groups = [prev[i: i + fanout] for i in range(0, len(prev), max(1, fanout))]
+        levels.append(await _merge_all(groups, merge, limit, on_done))
+    if len(levels[-1]) > 1:
+        levels.append(await _merge_all([levels[-1]], merge, limit, on_done))
+    return levels
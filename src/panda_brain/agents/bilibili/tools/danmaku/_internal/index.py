@@ -0,0 +1,69 @@
+"""弹幕时间索引：每个视频只排序一次，区间查询二分定位，O(log n + k)。"""
+
+from bisect import bisect_left
+from collections.abc import Iterable
+
+
+def clean_text(text: str) -> str:
+    """弹幕文本清洗：去首尾空白、换行转空格、截断到 100 字。"""
+    return text.strip().replace("\n", " ")[:100]
+
+
+class DanmakuIndex:
+    """按出现时间排序的弹幕序列：times 与 texts 一一对应。
+
+    区间均为左闭右开 [start, end)，单位秒。空文本在建索引时过滤。
+    """
+
+    __slots__ = ("times", "texts")
+
+    def __init__(self, records: Iterable[tuple[float, str]] = ()):
+        pairs = sorted(
+            ((float(t), s) for t, s in records if s),
+            key=lambda p: p[0],
+        )
+        self.times: list[float] = [t for t, _ in pairs]
+        self.texts: list[str] = [s for _, s in pairs]
+
+    def extend(self, records: Iterable[tuple[float, str]]) -> None:
+        """追加一批原始记录（经 clean_text 清洗）。
+
+        按段顺序追加时新记录都在已有记录之后，直接拼接；否则整体重排。
+        """
+        chunk = DanmakuIndex.from_records(records)
+        if not chunk.times:
+            return
+        if not self.times or chunk.times[0] >= self.times[-1]:
+            self.times.extend(chunk.times)
+            self.texts.extend(chunk.texts)
+            return
+        merged = DanmakuIndex(
+            list(zip(self.times, self.texts)) + list(zip(chunk.times, chunk.texts))
+        )
+        self.times, self.texts = merged.times, merged.texts
+
+    @classmethod
+    def from_records(cls, records: Iterable[tuple[float, str]]) -> "DanmakuIndex":
+        """由 (出现时间秒, 原始文本) 记录建索引，文本经 clean_text 清洗。"""
+        return cls((t, clean_text(s)) for t, s in records)
+
+    def __len__(self) -> int:
+        return len(self.times)
+
+    def span(self, start: float, end: float) -> tuple[int, int]:
+        """区间 [start, end) 在 times 中的下标范围。"""
+        lo = bisect_left(self.times, start)
+        hi = bisect_left(self.times, end, lo)
+        return lo, hi
+
+    def count(self, start: float, end: float) -> int:
+        lo, hi = self.span(start, end)
+        return hi - lo
+
+    def texts_between(self, start: float, end: float) -> list[str]:
+        lo, hi = self.span(start, end)
+        return self.texts[lo:hi]
+
+    def items_between(self, start: float, end: float) -> list[tuple[float, str]]:
+        lo, hi = self.span(start, end)
+        return list(zip(self.times[lo:hi], self.texts[lo:hi]))
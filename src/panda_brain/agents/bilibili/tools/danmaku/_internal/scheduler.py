@@ -0,0 +1,84 @@
+"""有界并发调度：同时最多 limit 个协程在跑，结果按提交顺序产出。"""
+
+import asyncio
+import sys
+from collections import deque
+from collections.abc import AsyncIterator, Awaitable, Callable, Iterable
+from contextvars import ContextVar
+from typing import TextIO, TypeVar
+
+T = TypeVar("T")
+
+# 设置后进度改为回调 (已完成数, 总数)，不再写 stderr（后台任务用来更新任务进度）
+progress_sink: ContextVar[Callable[[int, int], None] | None] = ContextVar("progress_sink", default=None)
+
+
+class Progress:
+    """stderr 单行进度条：已完成数/总数 + 最近完成项的标签。"""
+
+    def __init__(self, total: int, prefix: str = "正在分析", stream: TextIO | None = None):
+        self.total = total
+        self.done = 0
+        self.prefix = prefix
+        self.stream = stream or sys.stderr
+        self.sink = progress_sink.get()
+        if self.sink is not None:
+            self.sink(0, total)
+
+    def advance(self, label: str = "") -> None:
+        self.done += 1
+        if self.sink is not None:
+            self.sink(self.done, self.total)
+            return
+        self.stream.write(f"\r{self.prefix} {self.done}/{self.total} {label}…")
+        self.stream.flush()
+
+    def close(self) -> None:
+        if self.done and self.sink is None:
+            self.stream.write("\r" + " " * 60 + "\r")
+            self.stream.flush()
+
+
+async def ordered_map(
+    factories: Iterable[Callable[[], Awaitable[T]]],
+    limit: int,
+    on_done: Callable[[int, T], None] | None = None,
+) -> AsyncIterator[tuple[int, T]]:
+    """并发执行 factories，按提交顺序 yield (序号, 结果)。
+
+    limit 控制同时运行的协程数；预取的任务数最多 limit*2，避免一次创建全部任务。
+    on_done 在每个任务完成时立即回调（完成顺序，可用于进度展示）。
+    中途退出或异常时取消尚未完成的任务。
+    """
+    limit = max(1, limit)
+    sem = asyncio.Semaphore(limit)
+
+    async def _run(i: int, factory: Callable[[], Awaitable[T]]) -> T:
+        async with sem:
+            result = await factory()
+        if on_done is not None:
+            on_done(i, result)
+        return result
+
+    it = iter(enumerate(factories))
+    pending: deque[asyncio.Task[T]] = deque()
+
+    def _fill() -> None:
+        while len(pending) < limit * 2:
+            try:
+                i, factory = next(it)
+            except StopIteration:
+                return
+            pending.append(asyncio.ensure_future(_run(i, factory)))
+
+    idx = 0
+    try:
+        _fill()
+        while pending:
+            result = await pending.popleft()
+            _fill()
+            yield idx, result
+            idx += 1
+    finally:
+        for task in pending:
+            task.cancel()
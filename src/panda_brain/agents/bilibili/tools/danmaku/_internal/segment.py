@@ -1,7 +1,20 @@
 """三阶段分界点选取：密度低谷 → 密度低点 → 内容话题变化。"""
 
+from bisect import bisect_left
+
 from panda_brain.agents.bilibili.tools.danmaku._internal.content import content_split_point
-from panda_brain.agents.bilibili.tools.danmaku._internal.density import collect_minima
+from panda_brain.agents.bilibili.tools.danmaku._internal.density_np import collect_minima
+from panda_brain.agents.bilibili.tools.danmaku._internal.index import DanmakuIndex
+
+
+def _closest(positions: list[int], pos: int) -> int:
+    """positions 有序，二分找离 pos 最近的下标。"""
+    i = bisect_left(positions, pos)
+    if i == 0:
+        return 0
+    if i == len(positions):
+        return len(positions) - 1
+    return i if positions[i] - pos < pos - positions[i - 1] else i - 1
 
 
 def select_boundaries(
@@ -11,8 +24,7 @@ def select_boundaries(
     step_sec: int,
     max_seg_sec: int,
     min_seg_sec: int,
-    buckets: dict[int, list[str]],
-    bucket_sec: int,
+    index: DanmakuIndex,
     natural_depth: float = 0.2,
 ) -> list[int]:
     """三阶段选取分界点：
@@ -64,14 +76,9 @@ def select_boundaries(
             continue
 
         # 阶段 3：密度均匀 → 用弹幕内容话题变化切分
-        split_pos, change = content_split_point(
-            buckets, bucket_sec, s, e, margin,
-        )
+        split_pos, change = content_split_point(index, s, e, margin)
         if split_pos is not None and change > 0.05:
-            closest = min(
-                range(len(positions)),
-                key=lambda i: abs(positions[i] - split_pos),
-            )
+            closest = _closest(positions, split_pos)
             if closest not in selected and \
                positions[closest] > s + margin and \
                positions[closest] < e - margin:
@@ -80,7 +87,7 @@ def select_boundaries(
 
         # 兜底：中点切分
         mid = (s + e) // 2 // step_sec * step_sec
-        closest = min(range(len(positions)), key=lambda i: abs(positions[i] - mid))
+        closest = _closest(positions, mid)
         if closest not in selected and \
            positions[closest] > s + margin and \
            positions[closest] < e - margin:
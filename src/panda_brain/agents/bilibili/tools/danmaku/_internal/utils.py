@@ -1,5 +1,7 @@
 """弹幕分析共享工具函数。"""
 
+from panda_brain.agents.bilibili.tools.danmaku._internal.index import DanmakuIndex
+
 
 def fmt_ts(sec: int) -> str:
     """秒数格式化为 MM:SS。"""
@@ -21,17 +23,17 @@ def heat_label(peak: float, avg_peak: float) -> str:
 
 
 def segment_samples(
-    buckets: dict[int, list[str]], ts_list: list[int], count: int = 5
+    index: DanmakuIndex, seg_start: int, seg_end: int, count: int = 5
 ) -> list[str]:
-    """从段落中均匀采样弹幕，覆盖首/中/尾，去重。"""
-    if not ts_list:
+    """从段落 [seg_start, seg_end) 中均匀采样弹幕，覆盖首/中/尾，去重。"""
+    texts = index.texts_between(seg_start, seg_end)
+    if not texts:
         return []
-    step = max(1, len(ts_list) // count)
-    pick_indices = list(range(0, len(ts_list), step))[:count]
+    step = max(1, len(texts) // count)
     samples: list[str] = []
     seen: set[str] = set()
-    for idx in pick_indices:
-        for text in buckets.get(ts_list[idx], [])[:3]:
+    for idx in range(0, len(texts), step):
+        for text in texts[idx: idx + 3]:
             key = text[:30]
             if key not in seen:
                 seen.add(key)
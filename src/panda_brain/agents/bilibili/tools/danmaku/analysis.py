@@ -0,0 +1,817 @@
+"""弹幕剧情分析流水线：去重/压缩 → LLM 概括 → 按窗口增量产出并落盘（NDJSON，可断点续跑）。
+
+每个窗口记录去重后内容的指纹；同参数重跑时，内容与上次完整结果相比变化不大的窗口沿用上次的概括。
+"""
+
+import asyncio
+import json
+import math
+import os
+import re
+from bisect import bisect_left
+from collections import Counter
+from collections.abc import AsyncIterator
+from dataclasses import dataclass, field
+from datetime import datetime
+from functools import partial
+from pathlib import Path
+
+from bilibili_api import video
+
+from panda_brain.agents.bilibili import gateway
+from panda_brain.agents.bilibili.comments import fetch_top_comments
+from panda_brain.agents.bilibili.tools.danmaku._internal.density_np import density_curve
+from panda_brain.agents.bilibili.tools.danmaku._internal.fetch import SEGMENT_SEC, DanmakuFeed
+from panda_brain.agents.bilibili.tools.danmaku._internal.hierarchy import SummaryNode, build_tree, sliding_merge
+from panda_brain.agents.bilibili.tools.danmaku._internal.index import DanmakuIndex
+from panda_brain.agents.bilibili.tools.danmaku._internal.minhash import (
+    fingerprint,
+    fingerprint_similarity,
+    merge_similar_lsh,
+)
+from panda_brain.agents.bilibili.tools.danmaku._internal.scheduler import Progress, ordered_map
+from panda_brain.agents.bilibili.tools.danmaku._internal.segment import select_boundaries
+from panda_brain.agents.bilibili.tools.danmaku._internal.utils import heat_label, segment_samples
+from panda_brain.config import settings
+from panda_brain.llm import cache_stats, generate, generate_sentence, stream_stats
+
+# 窗口内：每批最多送 LLM 的条数，避免一次输入过多导致截断
+_BATCH_SIZE = 15
+# 去重后若仍超过此数，则分批概括再合并
+_MERGE_THRESHOLD = 25
+# 单次 prompt 最多展示的弹幕条数（去重后带计数）
+_MAX_ITEMS_IN_PROMPT = 50
+# 去重后条数超过此数时，相似合并改用 MinHash/LSH
+_LSH_MIN_ITEMS = 200
+# 分段模式：单段最长 / 最短秒数
+_SEGMENT_MAX_SEC = 300
+_SEGMENT_MIN_SEC = 60
+
+
+def _fmt_ts(sec: int) -> str:
+    """秒数 → MM:SS。"""
+    return f"{sec // 60:02d}:{sec % 60:02d}"
+
+
+def _normalize_danmaku(text: str) -> str:
+    """语法归一：去空白、重复字符合并，便于去重。"""
+    t = text.strip().replace("\n", " ").replace("\t", " ")
+    t = re.sub(r"\s+", " ", t).strip()
+    # 同一字符连续出现 2+ 次合并为 1 次（如 哈哈哈哈→哈哈，避免过长）
+    t = re.sub(r"(.)\1+", r"\1\1", t)
+    return t[:100]
+
+
+def _trigrams(s: str) -> set[str]:
+    """字符 trigram 集合，用于简单语义相似。"""
+    return {s[i : i + 3] for i in range(len(s) - 2)} if len(s) >= 3 else set()
+
+
+def _jaccard(a: set, b: set) -> float:
+    if not a and not b:
+        return 1.0
+    if not a or not b:
+        return 0.0
+    return len(a & b) / len(a | b)
+
+
+def _dedupe_window(texts: list[str]) -> list[tuple[str, int]]:
+    """语法去重：同文合并为 (文本, 出现次数)，按次数降序。"""
+    normalized = [_normalize_danmaku(t) for t in texts if _normalize_danmaku(t)]
+    cnt = Counter(normalized)
+    return sorted(cnt.items(), key=lambda x: -x[1])
+
+
+def _window_fingerprint(texts: list[str]) -> str:
+    """窗口内容指纹：去重后出现最多的 _MAX_ITEMS_IN_PROMPT 条（即送给 LLM 的部分）的 MinHash。"""
+    return fingerprint({text for text, _ in _dedupe_window(texts)[:_MAX_ITEMS_IN_PROMPT]})
+
+
+def _merge_similar(items: list[tuple[str, int]], thresh: float = 0.82) -> list[tuple[str, int]]:
+    """简单语义去重：trigram Jaccard 超过 thresh 的合并为一条，保留最长文本、次数相加。
+
+    条目多时改用 MinHash/LSH 只比较候选对，合并规则不变。
+    """
+    if len(items) <= 1:
+        return items
+    tris = [_trigrams(text) for text, _ in items]
+    if len(items) > _LSH_MIN_ITEMS:
+        return merge_similar_lsh(items, tris, thresh)
+    out: list[tuple[str, int]] = []
+    used = [False] * len(items)
+    for i, (text, count) in enumerate(items):
+        if used[i]:
+            continue
+        merged_text, merged_count = text, count
+        for j in range(i + 1, len(items)):
+            if used[j]:
+                continue
+            text2, count2 = items[j]
+            if _jaccard(tris[i], tris[j]) >= thresh:
+                used[j] = True
+                merged_count += count2
+                if len(text2) > len(merged_text):
+                    merged_text = text2
+        out.append((merged_text, merged_count))
+    return sorted(out, key=lambda x: -x[1])
+
+
+async def _llm_one_line(prompt: str, timeout: int = 25) -> str:
+    """单次流式 LLM 调用，满一句即停止，返回一行概括。"""
+    try:
+        text = await generate_sentence(prompt, timeout=timeout)
+        return text[:200] if text else ""
+    except Exception:
+        return ""
+
+
+async def _fetch_top_comments(bvid: str, top_n: int = 10) -> list[dict]:
+    """获取高赞评论（文本截断到 200 字），失败返回空列表。"""
+    try:
+        comments = await fetch_top_comments(bvid, top_n)
+    except Exception:
+        return []
+    return [{"text": c["text"][:200], "like": c["like"]} for c in comments]
+
+
+def _format_danmaku_for_prompt(items: list[tuple[str, int]], max_items: int = _MAX_ITEMS_IN_PROMPT) -> str:
+    """去重后的 (文本, 次数) 格式化为给 LLM 的短文本。"""
+    lines = [f"{text} (x{cnt})" if cnt > 1 else text for text, cnt in items[:max_items]]
+    return "\n".join(lines) if lines else "（无）"
+
+
+async def _summarize_batch(danmaku_block: str) -> str:
+    """对一批弹幕做一句话概括（输入不宜过长）。"""
+    prompt = f"""下面是一批弹幕（可能带 x数量），用一句话概括这批在讨论什么。只输出一句话，不要前缀和序号。
+
+弹幕：
+{danmaku_block}
+
+一句话概括："""
+    return await _llm_one_line(prompt)
+
+
+async def _merge_summaries(summaries: list[str], start_ts: str, end_ts: str) -> str:
+    """把多句概括合并成一句（循环压缩）。"""
+    if not summaries:
+        return ""
+    if len(summaries) == 1:
+        return summaries[0]
+    block = "\n".join(f"{i+1}. {s}" for i, s in enumerate(summaries))
+    prompt = f"""下面是对同一时间段（{start_ts}-{end_ts}）弹幕的多条概括，请合并成一句话。只输出一句，不要前缀。
+
+{block}
+
+合并成一句话："""
+    return await _llm_one_line(prompt)
+
+
+def _single_shot_prompt(
+    start_ts: str, end_ts: str, items: list[tuple[str, int]], comments: list[dict],
+) -> str:
+    """一次性概括的 prompt：去重后的弹幕（最多 _MAX_ITEMS_IN_PROMPT 条）+ 高赞评论。"""
+    danmaku_block = _format_danmaku_for_prompt(items)
+    comment_block = "\n".join(f"[赞{c['like']}] {c['text'][:120]}" for c in comments[:10])
+    return f"""根据以下弹幕（{start_ts}-{end_ts}）和评论，用一句话概括这段在讲什么。只输出一句。
+
+弹幕（去重后）：
+{danmaku_block}
+
+评论：
+{comment_block}
+
+一句话："""
+
+
+async def _analyze_interval_via_llm(
+    start_sec: int, end_sec: int,
+    danmaku_texts: list[str], comments: list[dict],
+) -> str:
+    """循环压缩：先语法/语义去重，若仍很多则分批概括再合并，避免一次输入过多导致截断。"""
+    start_ts = _fmt_ts(start_sec)
+    end_ts = _fmt_ts(end_sec)
+
+    # 1. 语法去重 → (文本, 次数)
+    items = _dedupe_window(danmaku_texts)
+    # 2. 简单语义去重：相似句合并
+    items = _merge_similar(items)
+
+    if not items:
+        return ""
+
+    # 3. 若条数不多，一次送 LLM（带评论）
+    if len(items) <= _MERGE_THRESHOLD:
+        return await _llm_one_line(_single_shot_prompt(start_ts, end_ts, items, comments))
+
+    # 4. 条数多：分批概括，再合并（循环压缩）
+    batch_summaries: list[str] = []
+    for i in range(0, len(items), _BATCH_SIZE):
+        batch = items[i : i + _BATCH_SIZE]
+        block = _format_danmaku_for_prompt(batch, max_items=_BATCH_SIZE)
+        s = await _summarize_batch(block)
+        if s:
+            batch_summaries.append(s)
+    if not batch_summaries:
+        return ""
+    merged = await _merge_summaries(batch_summaries, start_ts, end_ts)
+    return merged
+
+
+_BATCH_SCHEMA = {
+    "type": "object",
+    "properties": {
+        "summaries": {
+            "type": "array",
+            "items": {
+                "type": "object",
+                "properties": {
+                    "id": {"type": "integer"},
+                    "summary": {"type": "string"},
+                },
+                "required": ["id", "summary"],
+            },
+        },
+    },
+    "required": ["summaries"],
+}
+
+
+def _parse_batch_summaries(text: str, n: int) -> dict[int, str]:
+    """校验批量概括的 JSON：返回 {段号(1..n): 一句话}，无效条目丢弃。"""
+    try:
+        data = json.loads(text)
+    except ValueError:
+        return {}
+    entries = data.get("summaries") if isinstance(data, dict) else None
+    if not isinstance(entries, list):
+        return {}
+    parsed: dict[int, str] = {}
+    for entry in entries:
+        if not isinstance(entry, dict):
+            continue
+        sid, summary = entry.get("id"), entry.get("summary")
+        if not isinstance(sid, int) or not 1 <= sid <= n or not isinstance(summary, str):
+            continue
+        summary = summary.strip().splitlines()[0].strip() if summary.strip() else ""
+        if summary:
+            parsed[sid] = summary[:200]
+    return parsed
+
+
+async def _summarize_windows_batched(
+    spans: list[tuple[int, int]], texts: list[list[str]], comments: list[dict],
+) -> list[str]:
+    """多个窗口打包进一个 prompt，要求 Ollama 按 JSON Schema 返回每个窗口的一句话。
+
+    只有去重后条数不多的窗口参与打包；条数多的窗口、以及 JSON 中缺失或无效的窗口
+    在本组内依次回退为逐窗口概括。
+    """
+    items = [_merge_similar(_dedupe_window(t)) for t in texts]
+    results = [""] * len(spans)
+    packed = [i for i, it in enumerate(items) if 0 < len(it) <= _MERGE_THRESHOLD]
+
+    if len(packed) > 1:
+        blocks = "\n\n".join(
+            f"[段{k}] {_fmt_ts(spans[i][0])}-{_fmt_ts(spans[i][1])}\n"
+            + _format_danmaku_for_prompt(items[i])
+            for k, i in enumerate(packed, 1)
+        )
+        comment_block = "\n".join(f"[赞{c['like']}] {c['text'][:120]}" for c in comments[:10])
+        prompt = f"""下面是同一视频 {len(packed)} 个时间段的弹幕（去重后，可能带 x数量），以及视频的高赞评论。
+请分别用一句话概括每个时间段在讲什么。
+按 JSON 输出：{{"summaries": [{{"id": 段号, "summary": "一句话"}}]}}，每个段号一条，不要遗漏。
+
+评论：
+{comment_block}
+
+{blocks}"""
+        try:
+            text = await generate(
+                prompt, timeout=25 + 10 * len(packed), format=_BATCH_SCHEMA,
+                # 解析不出全部段号的回复不缓存，否则重跑时总是命中同一个坏结果
+                validate=lambda t: len(_parse_batch_summaries(t, len(packed))) == len(packed),
+            )
+        except Exception:
+            text = ""
+        parsed = _parse_batch_summaries(text, len(packed))
+        for k, i in enumerate(packed, 1):
+            results[i] = parsed.get(k, "")
+
+    # 逐个回退：调用方已按 PANDA_DANMAKU_LLM_CONCURRENCY 并发执行多组，组内再并发会超出上限
+    for i, it in enumerate(items):
+        if it and not results[i]:
+            results[i] = await _analyze_interval_via_llm(
+                spans[i][0], spans[i][1], texts[i], comments,
+            )
+    return results
+
+
+def _output_dir() -> Path:
+    return Path(os.environ.get("BILIBILI_ANALYSIS_OUTPUT_DIR", "output"))
+
+
+@dataclass
+class DanmakuAnalysis:
+    """一次弹幕分析的输入：视频信息、弹幕时间索引、评论与滑动窗口划分。
+
+    feed 非空时弹幕仍在后台拉取，index 随之增长；读取某区间前先 await wait_until(end)。
+    changes / reused 由 iter_danmaku_intervals 填写：与上次完整结果相比内容有变化的窗口，
+    以及沿用上次概括的窗口数（无上次结果时均为空）。
+    """
+
+    bvid: str
+    duration: int
+    analyze_duration: int
+    window_sec: int
+    step_sec: int
+    top_comments: int
+    index: DanmakuIndex
+    comments: list[dict]
+    windows: list[tuple[int, int]] = field(default_factory=list)
+    feed: DanmakuFeed | None = None
+    changes: list[dict] = field(default_factory=list)
+    reused: int = 0
+
+    @property
+    def danmaku_total(self) -> int:
+        return len(self.index)
+
+    async def wait_until(self, sec: float) -> None:
+        """等到 [0, sec) 的弹幕全部到齐。"""
+        if self.feed is not None:
+            await self.feed.wait_until(sec)
+
+    @property
+    def ndjson_path(self) -> Path:
+        """逐窗口追加写入的结果文件；同一视频同一参数固定同一路径，便于续跑。"""
+        return _output_dir() / (
+            f"bilibili_danmaku_{self.bvid}_w{self.window_sec}_s{self.step_sec}.ndjson"
+        )
+
+    @property
+    def prev_ndjson_path(self) -> Path:
+        """上一次完整跑完的结果，增量重跑时作为比较基准。"""
+        return self.ndjson_path.with_suffix(".prev.ndjson")
+
+    def header(self) -> dict:
+        return {
+            "type": "header",
+            "bvid": self.bvid,
+            "duration_sec": self.duration,
+            "window_sec": self.window_sec,
+            "step_sec": self.step_sec,
+            "top_comments": self.top_comments,
+        }
+
+
+async def prepare_analysis(
+    bvid: str,
+    window_sec: int = 30,
+    step_sec: int = 15,
+    top_comments: int = 10,
+    max_duration_sec: int | None = None,
+    wait: bool = True,
+) -> DanmakuAnalysis | None:
+    """拉取视频信息、弹幕与评论，建时间索引并划分窗口。无弹幕时返回 None。
+
+    弹幕各段在后台并发拉取，与评论拉取同时进行。wait=False 时不等弹幕全部到齐即返回
+    （此时不判断是否为空），调用方按窗口 await analysis.wait_until(end) 后再读取。
+    """
+    if window_sec < 15:
+        window_sec = 15
+    if step_sec < 5:
+        step_sec = 5
+    if step_sec > window_sec:
+        step_sec = window_sec
+    top_comments = max(1, min(100, top_comments))
+
+    v = video.Video(bvid=bvid, credential=gateway.get_credential())
+    info = await gateway.call("video.info", v.get_info)
+    duration = info.get("duration") or info.get("pages", [{}])[0].get("duration", 0)
+    if duration <= 0:
+        duration = 1500
+
+    analyze_duration = duration
+    if max_duration_sec is not None and max_duration_sec > 0:
+        analyze_duration = min(duration, max_duration_sec)
+
+    to_seg = max(0, int(duration / SEGMENT_SEC))
+    feed = DanmakuFeed(bvid, to_seg)
+    try:
+        comments = await _fetch_top_comments(bvid, top_n=top_comments)
+        if wait:
+            await feed.wait_all()
+    except BaseException:
+        feed.cancel()
+        raise
+    if wait and not len(feed.index):
+        return None
+
+    # 滑动窗口：start = 0, step_sec, 2*step_sec, ... 且 start < analyze_duration
+    windows = [
+        (start, min(start + window_sec, duration))
+        for start in range(0, analyze_duration, step_sec)
+    ]
+    return DanmakuAnalysis(
+        bvid=bvid,
+        duration=duration,
+        analyze_duration=analyze_duration,
+        window_sec=window_sec,
+        step_sec=step_sec,
+        top_comments=top_comments,
+        # 时间索引随分段到达增量扩充，每个窗口二分取区间
+        index=feed.index,
+        comments=comments,
+        windows=windows,
+        feed=None if feed.done else feed,
+    )
+
+
+def _interval_record(
+    start: int, end: int, danmaku_count: int, summary: str, fp: str | None = None,
+) -> dict:
+    rec = {
+        "start_sec": start,
+        "end_sec": end,
+        "start_ts": _fmt_ts(start),
+        "end_ts": _fmt_ts(end),
+        "danmaku_count": danmaku_count,
+        "summary": summary,
+    }
+    if fp is not None:
+        rec["fingerprint"] = fp
+    return rec
+
+
+def _read_ndjson(path: Path, header: dict) -> tuple[dict[int, dict], bool]:
+    """读取 NDJSON 结果：参数一致时返回 ({start_sec: 区间}, 是否有结束标记)，否则返回空。"""
+    try:
+        lines = path.read_text(encoding="utf-8").splitlines()
+    except OSError:
+        return {}, False
+    if not lines:
+        return {}, False
+    try:
+        if json.loads(lines[0]) != header:
+            return {}, False
+    except ValueError:
+        return {}, False
+    records: dict[int, dict] = {}
+    for line in lines[1:]:
+        try:
+            rec = json.loads(line)
+        except ValueError:
+            break  # 中断时写了一半的行
+        if rec.get("type") == "done":
+            return records, True
+        if rec.get("type") == "interval":
+            rec.pop("type")
+            records[rec["start_sec"]] = rec
+    return records, False
+
+
+def _completed(rec: dict) -> bool:
+    """区间是否已成功概括：有弹幕却没有概括说明 LLM 调用失败，续跑时需重做。"""
+    return bool(rec["summary"]) or not rec["danmaku_count"]
+
+
+def _reusable(prev: dict | None, end: int, fp: str) -> bool:
+    """上次同一窗口的内容与本次足够相似（指纹相似度达到阈值）时沿用其概括。
+
+    上次概括失败（有弹幕却无概括）的窗口不沿用，始终重新概括。
+    """
+    if prev is None or prev["end_sec"] != end or "fingerprint" not in prev:
+        return False
+    if not _completed(prev):
+        return False
+    return fingerprint_similarity(prev["fingerprint"], fp) >= settings.danmaku_reuse_similarity
+
+
+def _dump_line(rec: dict) -> str:
+    return json.dumps(rec, ensure_ascii=False) + "\n"
+
+
+async def _summarize_chunk(
+    analysis: DanmakuAnalysis, chunk: list[tuple[int, int]], baseline: dict[int, dict],
+) -> list[tuple[str, str]]:
+    """概括一组窗口，返回各窗口的 (概括, 指纹)；与 baseline 中内容相近的窗口不调用 LLM。"""
+    await analysis.wait_until(chunk[-1][1])
+    texts = [analysis.index.texts_between(s, e) for s, e in chunk]
+    fps = [_window_fingerprint(t) for t in texts]
+    summaries: list[str | None] = [None] * len(chunk)
+    for i, (s, e) in enumerate(chunk):
+        if _reusable(baseline.get(s), e, fps[i]):
+            # 沿用时连同指纹一起沿用：指纹始终对应生成概括时的内容，逐日的小变化会累积到阈值
+            summaries[i], fps[i] = baseline[s]["summary"], baseline[s]["fingerprint"]
+    todo = [i for i, summary in enumerate(summaries) if summary is None]
+    if len(todo) == 1:
+        (s, e), i = chunk[todo[0]], todo[0]
+        summaries[i] = await _analyze_interval_via_llm(s, e, texts[i], analysis.comments)
+    elif todo:
+        fresh = await _summarize_windows_batched(
+            [chunk[i] for i in todo], [texts[i] for i in todo], analysis.comments,
+        )
+        for i, summary in zip(todo, fresh):
+            summaries[i] = summary
+    return list(zip(summaries, fps))
+
+
+async def _window_summaries(
+    analysis: DanmakuAnalysis,
+    spans: list[tuple[int, int]],
+    progress: Progress,
+    baseline: dict[int, dict],
+) -> AsyncIterator[tuple[str, str]]:
+    """按顺序产出 spans 中各窗口的 (概括, 指纹)，有界并发。
+
+    PANDA_DANMAKU_BATCH_WINDOWS > 1 时每 N 个窗口打包为一次请求。
+    """
+    batch = max(1, settings.danmaku_batch_windows)
+    chunks = [spans[i: i + batch] for i in range(0, len(spans), batch)]
+
+    def _on_done(i: int, _: list[tuple[str, str]]) -> None:
+        for s, e in chunks[i]:
+            progress.advance(f"{_fmt_ts(s)}-{_fmt_ts(e)}")
+
+    results = ordered_map(
+        [partial(_summarize_chunk, analysis, c, baseline) for c in chunks],
+        settings.danmaku_llm_concurrency,
+        on_done=_on_done,
+    )
+    try:
+        async for _, summaries in results:
+            for item in summaries:
+                yield item
+    finally:
+        await results.aclose()
+
+
+# 每个 NDJSON 结果文件一把锁：同参数的两次分析（后台任务与对话中的调用等）依次进行，
+# 后一次直接续跑 / 沿用前一次的结果，而不是同时改写同一文件
+_ndjson_locks: dict[Path, asyncio.Lock] = {}
+
+
+async def iter_danmaku_intervals(
+    analysis: DanmakuAnalysis, resume: bool = True, incremental: bool | None = None,
+) -> AsyncIterator[dict]:
+    """按窗口顺序逐个产出区间结果，每个窗口概括完成即追加写入 analysis.ndjson_path。
+
+    resume=True 时，若同参数的 NDJSON 上次未写完（无结束标记），跳过其中已完成的窗口
+    （有弹幕但概括为空的窗口视为失败，重新概括）；全部窗口完成后写入结束标记。
+    窗口概括有界并发，产出顺序与窗口顺序一致。
+
+    incremental（默认 PANDA_DANMAKU_INCREMENTAL）：上次已完整跑完时，该结果移到
+    prev_ndjson_path 作为基准，内容指纹相似度不低于 PANDA_DANMAKU_REUSE_SIMILARITY 的窗口
+    沿用上次概括，其余重新概括并记入 analysis.changes。
+
+    同一 ndjson_path 同时只有一个分析在进行，其余等待前一个结束。
+    """
+    lock = _ndjson_locks.setdefault(analysis.ndjson_path, asyncio.Lock())
+    async with lock:
+        records = _iter_intervals(analysis, resume, incremental)
+        try:
+            async for rec in records:
+                yield rec
+        finally:
+            await records.aclose()
+
+
+async def _iter_intervals(
+    analysis: DanmakuAnalysis, resume: bool, incremental: bool | None,
+) -> AsyncIterator[dict]:
+    path = analysis.ndjson_path
+    path.parent.mkdir(parents=True, exist_ok=True)
+    header = analysis.header()
+    if incremental is None:
+        incremental = settings.danmaku_incremental
+    done, complete = _read_ndjson(path, header) if resume or incremental else ({}, False)
+    if complete:
+        # 上次已完整跑完：作为本次的比较基准保留下来，本次重新逐窗口判断
+        os.replace(path, analysis.prev_ndjson_path)
+        done = {}
+    elif not resume:
+        done = {}
+    baseline = _read_ndjson(analysis.prev_ndjson_path, header)[0] if incremental else {}
+
+    def _is_done(start: int, end: int) -> bool:
+        return start in done and done[start]["end_sec"] == end and _completed(done[start])
+
+    pending = [(s, e) for s, e in analysis.windows if not _is_done(s, e)]
+
+    # 重写文件：只保留表头与已完成的区间，丢弃中断时可能残留的半行
+    with path.open("w", encoding="utf-8") as f:
+        f.write(_dump_line(header))
+        for start, end in analysis.windows:
+            if _is_done(start, end):
+                f.write(_dump_line({"type": "interval", **done[start]}))
+
+    progress = Progress(len(pending))
+    summaries = _window_summaries(analysis, pending, progress, baseline)
+    try:
+        with path.open("a", encoding="utf-8") as f:
+            for start, end in analysis.windows:
+                if _is_done(start, end):
+                    _compare(analysis, baseline.get(start), done[start])
+                    yield done[start]
+                    continue
+                summary, fp = await anext(summaries)
+                rec = _interval_record(
+                    start, end, analysis.index.count(start, end), summary, fp,
+                )
+                _compare(analysis, baseline.get(start), rec)
+                f.write(_dump_line({"type": "interval", **rec}))
+                f.flush()
+                yield rec
+            f.write(_dump_line({"type": "done"}))
+        # 只分析前 N 秒时，后面的段仍拉完，弹幕总数与全量拉取时一致
+        await analysis.wait_until(math.inf)
+    finally:
+        await summaries.aclose()
+        progress.close()
+        if analysis.feed is not None and not analysis.feed.done:
+            analysis.feed.cancel()
+
+
+def _compare(analysis: DanmakuAnalysis, prev: dict | None, rec: dict) -> None:
+    """与上次完整结果中的同一窗口对比：沿用概括的计入 reused，重新概括的记入 changes。"""
+    if prev is None or prev["end_sec"] != rec["end_sec"]:
+        return
+    fp = rec.get("fingerprint", "")
+    if _reusable(prev, rec["end_sec"], fp):
+        analysis.reused += 1
+        return
+    analysis.changes.append({
+        "start_ts": rec["start_ts"],
+        "end_ts": rec["end_ts"],
+        "similarity": round(fingerprint_similarity(prev.get("fingerprint", ""), fp), 2),
+        "danmaku_count": [prev["danmaku_count"], rec["danmaku_count"]],
+        "summary": [prev["summary"], rec["summary"]],
+    })
+
+
+async def _summarize_segment(
+    start_sec: int, end_sec: int, danmaku_texts: list[str], comments: list[dict],
+) -> str:
+    """段落概括：去重后只取出现次数最多的若干条，一次 LLM 调用。"""
+    items = _merge_similar(_dedupe_window(danmaku_texts))
+    if not items:
+        return ""
+    prompt = _single_shot_prompt(_fmt_ts(start_sec), _fmt_ts(end_sec), items, comments)
+    return await _llm_one_line(prompt)
+
+
+async def analyze_segments(analysis: DanmakuAnalysis) -> list[dict]:
+    """分段模式：按弹幕密度低谷 / 话题变化把视频切成自然剧情段，每段一次 LLM 概括。
+
+    返回每段的时间、弹幕数、峰值密度、精彩度、代表弹幕与一句话剧情。
+    """
+    duration = analysis.analyze_duration
+    positions, densities, smoothed = density_curve(
+        analysis.index, duration, analysis.window_sec, analysis.step_sec,
+    )
+    cut_idx = select_boundaries(
+        smoothed, positions, duration, analysis.step_sec,
+        _SEGMENT_MAX_SEC, _SEGMENT_MIN_SEC, analysis.index,
+    )
+    cuts = [0] + [positions[i] for i in cut_idx] + [duration]
+    segments = [(s, e) for s, e in zip(cuts, cuts[1:]) if e > s]
+
+    # 每段峰值密度：段内各滑动窗口密度的最大值
+    peaks: list[float] = []
+    for s, e in segments:
+        lo, hi = bisect_left(positions, s), bisect_left(positions, e)
+        peaks.append(max(densities[lo:hi], default=0.0))
+    avg_peak = sum(peaks) / len(peaks) if peaks else 0.0
+
+    progress = Progress(len(segments), prefix="正在概括段落")
+    factories = [
+        partial(
+            _summarize_segment,
+            s, e, analysis.index.texts_between(s, e), analysis.comments,
+        )
+        for s, e in segments
+    ]
+    results: list[dict] = []
+    try:
+        async for i, summary in ordered_map(
+            factories,
+            settings.danmaku_llm_concurrency,
+            on_done=lambda i, _: progress.advance(
+                f"{_fmt_ts(segments[i][0])}-{_fmt_ts(segments[i][1])}"
+            ),
+        ):
+            s, e = segments[i]
+            results.append({
+                "segment": i + 1,
+                "start_sec": s,
+                "end_sec": e,
+                "start_ts": _fmt_ts(s),
+                "end_ts": _fmt_ts(e),
+                "danmaku_count": analysis.index.count(s, e),
+                "peak_density": peaks[i],
+                "heat": heat_label(peaks[i], avg_peak),
+                "samples": segment_samples(analysis.index, s, e),
+                "summary": summary,
+            })
+    finally:
+        progress.close()
+    return results
+
+
+async def _merge_summaries_at(summaries: list[str], start_sec: int, end_sec: int) -> str:
+    return await _merge_summaries(summaries, _fmt_ts(start_sec), _fmt_ts(end_sec))
+
+
+async def analyze_hierarchical(analysis: DanmakuAnalysis) -> tuple[list[dict], dict[str, list[dict]]]:
+    """层级模式：每个 step_sec 长的不重叠块只概括一次，重叠窗口由相邻块的概括合并得到；
+    再逐层合并出分钟、幕（约 5 分钟）和全集概括。
+
+    返回 (窗口结果, {层名: 该层各节点})，窗口结果与 window 模式字段一致。层名依次为
+    block / minute / act / episode，时长较短时没有的中间层不出现（如 5 分钟以内没有 act）。
+    """
+    step = analysis.step_sec
+    limit = settings.danmaku_llm_concurrency
+    spans = [
+        (start, min(start + step, analysis.duration))
+        for start in range(0, analysis.analyze_duration, step)
+    ]
+    width = -(-analysis.window_sec // step)
+    minute_fanout = max(1, round(60 / step))
+    # 进度总数：叶子 + 窗口 + 分钟 + 幕 + 全集
+    minutes = -(-len(spans) // minute_fanout) if len(spans) > 1 else 0
+    acts = -(-minutes // 5) if minutes > 1 else 0
+    progress = Progress(
+        2 * len(spans) + minutes + acts + (1 if acts > 1 else 0), prefix="正在层级概括",
+    )
+
+    def _advance(_: int, node: SummaryNode) -> None:
+        progress.advance(f"{_fmt_ts(node.start_sec)}-{_fmt_ts(node.end_sec)}")
+
+    try:
+        factories = [
+            partial(
+                _analyze_interval_via_llm,
+                s, e, analysis.index.texts_between(s, e), analysis.comments,
+            )
+            for s, e in spans
+        ]
+        leaves: list[SummaryNode] = []
+        async for i, summary in ordered_map(
+            factories, limit,
+            on_done=lambda i, _: progress.advance(
+                f"{_fmt_ts(spans[i][0])}-{_fmt_ts(spans[i][1])}"
+            ),
+        ):
+            leaves.append(SummaryNode(spans[i][0], spans[i][1], summary))
+
+        windows = await sliding_merge(leaves, width, _merge_summaries_at, limit, _advance)
+        levels = await build_tree(leaves, [minute_fanout, 5], _merge_summaries_at, limit, _advance)
+    finally:
+        progress.close()
+
+    # 窗口由 width 个叶子合并而来，实际覆盖 width*step 秒（不一定等于 window_sec）
+    intervals = [
+        _interval_record(
+            w.start_sec, w.end_sec, analysis.index.count(w.start_sec, w.end_sec), w.summary,
+        )
+        for w in windows
+    ]
+    # 层数随时长变化（短片没有分钟 / 幕层）：最后一层总是全集，其余自下而上依次命名
+    tree = {
+        name: [n.to_dict() for n in level]
+        for name, level in zip(("block", "minute", "act"), levels[:-1])
+    }
+    tree["episode"] = [n.to_dict() for n in levels[-1]]
+    return intervals, tree
+
+
+def export_json(
+    analysis: DanmakuAnalysis, intervals: list[dict], mode: str = "window", **extra,
+) -> Path:
+    """把完整结果写成一个带时间戳的 JSON 文件，返回路径。
+
+    分段模式的结果放在 segments 下；extra 中的字段原样并入（如层级模式的 levels）。
+    """
+    out_dir = _output_dir()
+    out_dir.mkdir(parents=True, exist_ok=True)
+    ts_str = datetime.now().strftime("%Y%m%d_%H%M%S")
+    out_path = out_dir / f"bilibili_danmaku_{analysis.bvid}_{ts_str}.json"
+    export_payload = {
+        "bvid": analysis.bvid,
+        "mode": mode,
+        "duration_sec": analysis.duration,
+        "window_sec": analysis.window_sec,
+        "step_sec": analysis.step_sec,
+        "danmaku_count": analysis.danmaku_total,
+        "top_comments": analysis.top_comments,
+        "segments" if mode == "segment" else "intervals": intervals,
+        **extra,
+        "llm_cache": cache_stats(),
+        "llm_stream": stream_stats(),
+        "bilibili_api": gateway.stats(),
+    }
+    out_path.write_text(
+        json.dumps(export_payload, ensure_ascii=False, indent=2),
+        encoding="utf-8",
+    )
+    return out_path
@@ -1,204 +1,21 @@
 """弹幕相关 tool_plain 注册入口。"""
 
-import json
-import os
-import re
-import sys
-from collections import Counter
-from datetime import datetime
-from pathlib import Path
-
-import httpx
-from bilibili_api import Credential, video
-from bilibili_api import comment as comment_api
-from bilibili_api.comment import CommentResourceType, OrderType
-from bilibili_api.utils.aid_bvid_transformer import bvid2aid
+from collections.abc import Callable
 
 from panda_brain.agents.bilibili.agent import bilibili_agent
-from panda_brain.config import settings
-
-# 窗口内：每批最多送 LLM 的条数，避免一次输入过多导致截断
-_BATCH_SIZE = 15
-# 去重后若仍超过此数，则分批概括再合并
-_MERGE_THRESHOLD = 25
-# 单次 prompt 最多展示的弹幕条数（去重后带计数）
-_MAX_ITEMS_IN_PROMPT = 50
-
-
-def _fmt_ts(sec: int) -> str:
-    """秒数 → MM:SS。"""
-    return f"{sec // 60:02d}:{sec % 60:02d}"
-
-
-def _normalize_danmaku(text: str) -> str:
-    """语法归一：去空白、重复字符合并，便于去重。"""
-    t = text.strip().replace("\n", " ").replace("\t", " ")
-    t = re.sub(r"\s+", " ", t).strip()
-    # 同一字符连续出现 2+ 次合并为 1 次（如 哈哈哈哈→哈哈，避免过长）
-    t = re.sub(r"(.)\1+", r"\1\1", t)
-    return t[:100]
-
-
-def _trigrams(s: str) -> set[str]:
-    """字符 trigram 集合，用于简单语义相似。"""
-    return {s[i : i + 3] for i in range(len(s) - 2)} if len(s) >= 3 else set()
-
-
-def _jaccard(a: set, b: set) -> float:
-    if not a and not b:
-        return 1.0
-    if not a or not b:
-        return 0.0
-    return len(a & b) / len(a | b)
-
-
-def _dedupe_window(texts: list[str]) -> list[tuple[str, int]]:
-    """语法去重：同文合并为 (文本, 出现次数)，按次数降序。"""
-    normalized = [_normalize_danmaku(t) for t in texts if _normalize_danmaku(t)]
-    cnt = Counter(normalized)
-    return sorted(cnt.items(), key=lambda x: -x[1])
-
-
-def _merge_similar(items: list[tuple[str, int]], thresh: float = 0.82) -> list[tuple[str, int]]:
-    """简单语义去重：trigram Jaccard 超过 thresh 的合并为一条，保留最长文本、次数相加。"""
-    if len(items) <= 1:
-        return items
-    out: list[tuple[str, int]] = []
-    used = [False] * len(items)
-    for i, (text, count) in enumerate(items):
-        if used[i]:
-            continue
-        tri = _trigrams(text)
-        merged_text, merged_count = text, count
-        for j in range(i + 1, len(items)):
-            if used[j]:
-                continue
-            text2, count2 = items[j]
-            if _jaccard(tri, _trigrams(text2)) >= thresh:
-                used[j] = True
-                merged_count += count2
-                if len(text2) > len(merged_text):
-                    merged_text = text2
-        out.append((merged_text, merged_count))
-    return sorted(out, key=lambda x: -x[1])
-
-
-async def _llm_one_line(prompt: str, timeout: int = 25) -> str:
-    """单次 LLM 调用，返回一行概括，避免长输出中断。"""
-    ollama_host = settings.ollama_base_url.rstrip("/").removesuffix("/v1")
-    try:
-        async with httpx.AsyncClient(timeout=timeout) as client:
-            r = await client.post(
-                f"{ollama_host}/api/generate",
-                json={
-                    "model": settings.default_model,
-                    "prompt": prompt,
-                    "stream": False,
-                },
-            )
-            r.raise_for_status()
-            text = (r.json().get("response") or "").strip()
-            return text[:200] if text else ""
-    except Exception:
-        return ""
-
-
-async def _fetch_top_comments(bvid: str, top_n: int = 10) -> list[dict]:
-    """获取高赞评论，失败返回空列表。"""
-    try:
-        sessdata = os.environ.get("BILIBILI_SESSDATA", "")
-        cred = Credential(sessdata=sessdata) if sessdata else Credential()
-        aid = bvid2aid(bvid)
-        result = await comment_api.get_comments(
-            oid=aid, type_=CommentResourceType.VIDEO,
-            page_index=1, order=OrderType.LIKE, credential=cred,
-        )
-        comments: list[dict] = []
-        for r in (result.get("replies") or [])[:top_n]:
-            msg = (r.get("content") or {}).get("message", "").strip()
-            like = r.get("like", 0)
-            if msg:
-                comments.append({"text": msg[:200], "like": like})
-        return comments
-    except Exception:
-        return []
-
-
-def _format_danmaku_for_prompt(items: list[tuple[str, int]], max_items: int = _MAX_ITEMS_IN_PROMPT) -> str:
-    """去重后的 (文本, 次数) 格式化为给 LLM 的短文本。"""
-    lines = [f"{text} (x{cnt})" if cnt > 1 else text for text, cnt in items[:max_items]]
-    return "\n".join(lines) if lines else "（无）"
-
-
-async def _summarize_batch(danmaku_block: str) -> str:
-    """对一批弹幕做一句话概括（输入不宜过长）。"""
-    prompt = f"""下面是一批弹幕（可能带 x数量），用一句话概括这批在讨论什么。只输出一句话，不要前缀和序号。
-
-弹幕：
-{danmaku_block}
-
-一句话概括："""
-    return await _llm_one_line(prompt)
-
-
-async def _merge_summaries(summaries: list[str], start_ts: str, end_ts: str) -> str:
-    """把多句概括合并成一句（循环压缩）。"""
-    if not summaries:
-        return ""
-    if len(summaries) == 1:
-        return summaries[0]
-    block = "\n".join(f"{i+1}. {s}" for i, s in enumerate(summaries))
-    prompt = f"""下面是对同一时间段（{start_ts}-{end_ts}）弹幕的多条概括，请合并成一句话。只输出一句，不要前缀。
-
-{block}
-
-合并成一句话："""
-    return await _llm_one_line(prompt)
-
-
-async def _analyze_interval_via_llm(
-    start_sec: int, end_sec: int,
-    danmaku_texts: list[str], comments: list[dict],
-) -> str:
-    """循环压缩：先语法/语义去重，若仍很多则分批概括再合并，避免一次输入过多导致截断。"""
-    start_ts = _fmt_ts(start_sec)
-    end_ts = _fmt_ts(end_sec)
-
-    # 1. 语法去重 → (文本, 次数)
-    items = _dedupe_window(danmaku_texts)
-    # 2. 简单语义去重：相似句合并
-    items = _merge_similar(items)
-
-    if not items:
-        return ""
-
-    # 3. 若条数不多，一次送 LLM（带评论）
-    if len(items) <= _MERGE_THRESHOLD:
-        danmaku_block = _format_danmaku_for_prompt(items)
-        comment_block = "\n".join(f"[赞{c['like']}] {c['text'][:120]}" for c in comments[:10])
-        prompt = f"""根据以下弹幕（{start_ts}-{end_ts}）和评论，用一句话概括这段在讲什么。只输出一句。
-
-弹幕（去重后）：
-{danmaku_block}
-
-评论：
-{comment_block}
-
-一句话："""
-        return await _llm_one_line(prompt)
-
-    # 4. 条数多：分批概括，再合并（循环压缩）
-    batch_summaries: list[str] = []
-    for i in range(0, len(items), _BATCH_SIZE):
-        batch = items[i : i + _BATCH_SIZE]
-        block = _format_danmaku_for_prompt(batch, max_items=_BATCH_SIZE)
-        s = await _summarize_batch(block)
-        if s:
-            batch_summaries.append(s)
-    if not batch_summaries:
-        return ""
-    merged = await _merge_summaries(batch_summaries, start_ts, end_ts)
-    return merged
+from panda_brain.agents.bilibili.tools.danmaku._internal.fetch import fetch_danmaku_records
+from panda_brain.agents.bilibili.tools.danmaku._internal.index import DanmakuIndex
+from panda_brain.agents.bilibili.tools.danmaku._internal.scheduler import progress_sink
+from panda_brain.agents.bilibili.tools.danmaku._internal.utils import fmt_ts
+from panda_brain.agents.bilibili.tools.danmaku.analysis import (
+    DanmakuAnalysis,
+    analyze_hierarchical,
+    analyze_segments,
+    export_json,
+    iter_danmaku_intervals,
+    prepare_analysis,
+)
+from panda_brain.jobs import get_queue
 
 
 @bilibili_agent.tool_plain
@@ -210,22 +27,20 @@ async def get_danmakus(
     if limit <= 0 or limit > 500:
         limit = 100
     try:
-        v = video.Video(bvid=bvid)
         from_seg = max(0, int(from_min // 6))
         to_seg = max(from_seg, int((to_min - 1) // 6))
-        danmakus = await v.get_danmakus(
-            page_index=0, from_seg=from_seg, to_seg=to_seg,
-        )
+        records = await fetch_danmaku_records(bvid, from_seg, to_seg)
+        index = DanmakuIndex.from_records(records)
+        in_range = index.items_between(from_min * 60, to_min * 60)
         lines: list[str] = []
-        for i, dm in enumerate(danmakus[:limit], 1):
-            ts = int(dm.dm_time)
+        for i, (dm_time, text) in enumerate(in_range[:limit], 1):
+            ts = int(dm_time)
             m, s = ts // 60, ts % 60
-            text = dm.text.strip().replace("\n", " ")
             lines.append(
                 f"{i}. [{m:02d}:{s:02d}] {text[:80]}"
                 f"{'...' if len(text) > 80 else ''}"
             )
-        total = len(danmakus)
+        total = len(in_range)
         head = f"弹幕（{bvid}，前{min(limit, total)}条"
         if total > limit:
             head += f"，共{total}条"
@@ -234,6 +49,101 @@ async def get_danmakus(
         return f"获取失败: {e}"
 
 
+async def _report_segments(analysis: DanmakuAnalysis) -> str:
+    """分段模式的输出：每段一行「段落号 时间 弹幕数 精彩度 | 剧情 | 关键弹幕」。"""
+    segments = await analyze_segments(analysis)
+    limit_note = ""
+    if analysis.analyze_duration < analysis.duration:
+        limit_note = f"（仅前{analysis.analyze_duration}秒）"
+    lines = [
+        f"【弹幕剧情分段】{analysis.bvid} 时长{fmt_ts(analysis.duration)} "
+        f"弹幕{analysis.danmaku_total}条 评论{len(analysis.comments)}条 "
+        f"共{len(segments)}段{limit_note}",
+        "",
+    ]
+    for seg in segments:
+        lines.append(
+            f"{seg['segment']}. {seg['start_ts']}-{seg['end_ts']} "
+            f"{seg['danmaku_count']}条 {seg['heat']} | {seg['summary'] or '（无概括）'} | "
+            + " / ".join(seg["samples"])
+        )
+    out_path = export_json(analysis, segments, mode="segment")
+    return f"完整数据已写入 {out_path}\n\n" + "\n".join(lines)
+
+
+async def _run_analysis(
+    bvid: str,
+    window_sec: int = 30,
+    step_sec: int = 15,
+    top_comments: int = 10,
+    max_duration_sec: int | None = None,
+    mode: str = "window",
+) -> str:
+    """执行一次弹幕分析并返回报告文本（analyze_danmaku_density 与后台任务共用），失败时抛出异常。"""
+    if mode not in ("window", "segment", "hierarchical"):
+        mode = "window"
+    # 滑动窗口模式不等弹幕全部拉完，前面的窗口边下载边分析
+    analysis = await prepare_analysis(
+        bvid, window_sec, step_sec, top_comments, max_duration_sec,
+        wait=mode != "window",
+    )
+    if analysis is None:
+        return "暂无弹幕，无法分析。"
+
+    if mode == "segment":
+        return await _report_segments(analysis)
+
+    levels: dict[str, list[dict]] = {}
+    if mode == "hierarchical":
+        results, levels = await analyze_hierarchical(analysis)
+    else:
+        results = [r async for r in iter_danmaku_intervals(analysis)]
+        if not analysis.danmaku_total:
+            return "暂无弹幕，无法分析。"
+
+    # 输出
+    limit_note = ""
+    if analysis.analyze_duration < analysis.duration:
+        limit_note = f"（仅前{analysis.analyze_duration}秒）"
+    lines = [
+        f"【弹幕剧情分析】{bvid} 时长{fmt_ts(analysis.duration)} "
+        f"弹幕{analysis.danmaku_total}条 评论{len(analysis.comments)}条 "
+        f"滑动窗口{analysis.window_sec}秒 步进{analysis.step_sec}秒{limit_note}",
+        "",
+    ]
+    for r in results:
+        line = f"{r['start_ts']}-{r['end_ts']}（{r['danmaku_count']}条弹幕）"
+        if r["summary"]:
+            line += " " + r["summary"]
+        lines.append(line)
+    if levels.get("act"):
+        lines += ["", "【分幕概括】"]
+        lines += [f"{n['start_ts']}-{n['end_ts']} {n['summary']}" for n in levels["act"]]
+    if levels:
+        lines += ["", "【全集概括】"] + [n["summary"] for n in levels["episode"]]
+
+    if analysis.changes or analysis.reused:
+        lines += [
+            "",
+            f"【与上次相比】{len(analysis.changes)} 个窗口内容有变化、已重新概括，"
+            f"{analysis.reused} 个变化不大、沿用上次概括",
+        ]
+        for c in analysis.changes:
+            (old_count, new_count), (old_summary, new_summary) = c["danmaku_count"], c["summary"]
+            lines.append(
+                f"{c['start_ts']}-{c['end_ts']} 弹幕{old_count}→{new_count}条 相似度{c['similarity']}："
+                f"{old_summary or '（无概括）'} → {new_summary or '（无概括）'}"
+            )
+
+    extra = {"levels": levels} if levels else {}
+    if analysis.changes or analysis.reused:
+        extra.update(changes=analysis.changes, reused_windows=analysis.reused)
+    out_path = export_json(analysis, results, mode=mode, **extra)
+    return (
+        f"完整数据已写入 {out_path}\n\n" + "\n".join(lines)
+    )
+
+
 @bilibili_agent.tool_plain
 async def analyze_danmaku_density(
     bvid: str,
@@ -241,108 +151,101 @@ async def analyze_danmaku_density(
     step_sec: int = 15,
     top_comments: int = 10,
     max_duration_sec: int | None = None,
+    mode: str = "window",
 ) -> str:
     """使用滑动窗口，根据弹幕以及前 N 条高赞评论，分析每个时间区间在讲什么事情。
     30 秒区间、15 秒交叉步进，重叠窗口便于发现一大段剧情。
+    mode："window"（默认）逐个滑动窗口概括；"segment" 先按弹幕密度低谷和话题变化
+    把视频切成自然剧情段，每段一次概括并标注精彩度与代表弹幕，LLM 调用少一个数量级，
+    分析整集时优先使用；"hierarchical" 每个 step_sec 块只概括一次，重叠窗口由相邻块合并，
+    并额外给出分幕与全集概括。
     window_sec：窗口长度（秒），默认 30。
     step_sec：步进（秒），默认 15（与窗口交叉 15 秒）。
     top_comments：参与分析的评论条数，默认 10（可改为 100）。
-    max_duration_sec：只分析视频前 N 秒，不传则分析全片（长片会很多次 LLM 调用，耗时长）。"""
-    if window_sec < 15:
-        window_sec = 15
-    if step_sec < 5:
-        step_sec = 5
-    if step_sec > window_sec:
-        step_sec = window_sec
-    top_comments = max(1, min(100, top_comments))
-
+    max_duration_sec：只分析视频前 N 秒，不传则分析全片（长片会很多次 LLM 调用，耗时长，
+    此时改用 submit_danmaku_analysis 在后台执行）。
+    各窗口的 LLM 概括并发进行，并发数由 PANDA_DANMAKU_LLM_CONCURRENCY 控制；
+    每个窗口完成即追加写入 NDJSON，中断后以相同参数重跑会跳过已完成的窗口；
+    上次已完整跑完时，弹幕内容变化不大的窗口沿用上次概括，并报告有变化的窗口。"""
     try:
-        v = video.Video(bvid=bvid)
-        info = await v.get_info()
-        duration = info.get("duration") or info.get("pages", [{}])[0].get("duration", 0)
-        if duration <= 0:
-            duration = 1500
+        return await _run_analysis(bvid, window_sec, step_sec, top_comments, max_duration_sec, mode)
+    except Exception as e:
+        return f"分析失败: {e}"
+
+
+async def _analysis_job(params: dict, report: Callable[[int, int], None]) -> str:
+    """后台任务：进度改为回调给任务队列，不再写 stderr。"""
+    progress_sink.set(report)
+    return await _run_analysis(**params)
 
-        analyze_duration = duration
-        if max_duration_sec is not None and max_duration_sec > 0:
-            analyze_duration = min(duration, max_duration_sec)
 
-        to_seg = max(0, int(duration / 360))
-        danmakus = await v.get_danmakus(
-            page_index=0, from_seg=0, to_seg=to_seg,
+get_queue().register("danmaku_analysis", _analysis_job)
+
+
+@bilibili_agent.tool_plain
+async def submit_danmaku_analysis(
+    bvid: str,
+    window_sec: int = 30,
+    step_sec: int = 15,
+    top_comments: int = 10,
+    max_duration_sec: int | None = None,
+    mode: str = "window",
+    priority: int = 0,
+) -> str:
+    """在后台执行 analyze_danmaku_density（参数含义相同），立即返回任务 ID，不占用当前对话。
+    整集 / 长片分析时使用。priority 越大越先执行。
+    之后用 get_job_status(job_id) 查看进度，完成后用 get_job_result(job_id) 取结果，
+    cancel_job(job_id) 取消。"""
+    try:
+        job = get_queue().submit(
+            "danmaku_analysis",
+            {
+                "bvid": bvid,
+                "window_sec": window_sec,
+                "step_sec": step_sec,
+                "top_comments": top_comments,
+                "max_duration_sec": max_duration_sec,
+                "mode": mode,
+            },
+            priority=priority,
         )
-        if not danmakus:
-            return "暂无弹幕，无法分析。"
+        return f"已提交，任务 ID: {job.id}\n{job.describe()}"
+    except Exception as e:
+        return f"提交失败: {e}"
 
-        comments = await _fetch_top_comments(bvid, top_n=top_comments)
 
-        # 区间数量（与下面 while 一致：start = 0, step_sec, 2*step_sec, ... 且 start < analyze_duration）
-        num_windows = max(1, (analyze_duration + step_sec - 1) // step_sec)
+@bilibili_agent.tool_plain
+async def get_job_status(job_id: str = "") -> str:
+    """查看后台任务的状态与进度（已完成数/总数）；不传 job_id 时列出全部任务。"""
+    queue = get_queue()
+    if not job_id:
+        jobs = queue.jobs()
+        return "\n".join(j.describe() for j in jobs) if jobs else "暂无后台任务。"
+    job = queue.get(job_id)
+    if job is None:
+        return f"任务不存在: {job_id}"
+    if job.status == "done":
+        return job.describe() + "，用 get_job_result 获取结果。"
+    return job.describe()
 
-        # 滑动窗口：每个窗口内的弹幕文本
-        results: list[dict] = []
-        start = 0
-        idx = 0
-        while start < analyze_duration:
-            end = min(start + window_sec, duration)
-            in_window = [
-                dm.text.strip().replace("\n", " ")[:100]
-                for dm in danmakus
-                if start <= int(dm.dm_time) < end and dm.text.strip()
-            ]
-            idx += 1
-            sys.stderr.write(f"\r正在分析 {idx}/{num_windows} {_fmt_ts(start)}-{_fmt_ts(end)}…")
-            sys.stderr.flush()
-            summary = await _analyze_interval_via_llm(
-                start, end, in_window, comments
-            )
-            results.append({
-                "start_sec": start,
-                "end_sec": end,
-                "start_ts": _fmt_ts(start),
-                "end_ts": _fmt_ts(end),
-                "danmaku_count": len(in_window),
-                "summary": summary,
-            })
-            start += step_sec
-        if num_windows > 0:
-            sys.stderr.write("\r" + " " * 60 + "\r")
-            sys.stderr.flush()
 
-        # 输出
-        limit_note = f"（仅前{analyze_duration}秒）" if analyze_duration < duration else ""
-        lines = [
-            f"【弹幕剧情分析】{bvid} 时长{_fmt_ts(duration)} "
-            f"弹幕{len(danmakus)}条 评论{len(comments)}条 滑动窗口{window_sec}秒 步进{step_sec}秒{limit_note}",
-            "",
-        ]
-        for r in results:
-            line = f"{r['start_ts']}-{r['end_ts']}（{r['danmaku_count']}条弹幕）"
-            if r["summary"]:
-                line += " " + r["summary"]
-            lines.append(line)
+@bilibili_agent.tool_plain
+async def get_job_result(job_id: str) -> str:
+    """获取已完成的后台任务的结果；未完成时返回当前状态。"""
+    job = get_queue().get(job_id)
+    if job is None:
+        return f"任务不存在: {job_id}"
+    if job.status != "done":
+        return job.describe()
+    return job.result if isinstance(job.result, str) else str(job.result)
 
-        # 写入 JSON
-        out_dir = Path(os.environ.get("BILIBILI_ANALYSIS_OUTPUT_DIR", "output"))
-        out_dir.mkdir(parents=True, exist_ok=True)
-        ts_str = datetime.now().strftime("%Y%m%d_%H%M%S")
-        out_path = out_dir / f"bilibili_danmaku_{bvid}_{ts_str}.json"
-        export_payload = {
-            "bvid": bvid,
-            "duration_sec": duration,
-            "window_sec": window_sec,
-            "step_sec": step_sec,
-            "danmaku_count": len(danmakus),
-            "top_comments": top_comments,
-            "intervals": results,
-        }
-        out_path.write_text(
-            json.dumps(export_payload, ensure_ascii=False, indent=2),
-            encoding="utf-8",
-        )
 
-        return (
-            f"完整数据已写入 {out_path}\n\n" + "\n".join(lines)
-        )
-    except Exception as e:
-        return f"分析失败: {e}"
+@bilibili_agent.tool_plain
+async def cancel_job(job_id: str) -> str:
+    """取消排队中或运行中的后台任务。"""
+    job = get_queue().cancel(job_id)
+    if job is None:
+        return f"任务不存在: {job_id}"
+    if job.finished and job.status != "cancelled":
+        return job.describe() + "，无需取消。"
+    return f"已取消任务 {job_id}。"
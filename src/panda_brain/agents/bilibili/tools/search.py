@@ -1,51 +1,157 @@
+import asyncio
+import json
+import os
 import re
+from functools import partial
+from pathlib import Path
 
 from bilibili_api import search
 from bilibili_api.search import SearchObjectType
 
+from panda_brain.agents.bilibili import gateway
 from panda_brain.agents.bilibili.agent import bilibili_agent
+from panda_brain.cache import DiskCache
+from panda_brain.config import settings
+
+_cache = DiskCache(
+    "search",
+    ttl_sec=settings.search_cache_ttl_sec,
+    max_bytes=16 * 1024 * 1024,
+)
 
 
 def _strip_html(s: str) -> str:
     return re.sub(r"<[^>]+>", "", s) if s else ""
 
 
+def _normalize(name: str) -> str:
+    """别名归一化：小写、去掉空白与标点，「OVERLORD 第四季」与「overlord第四季」视为同一个。"""
+    return re.sub(r"[\W_]+", "", name.lower())
+
+
+class _AliasIndex:
+    """本地别名索引（cache_dir/bangumi_aliases.json），由历次搜索结果积累，不过期。
+
+    - names：归一化名称 → ssid 列表。名称包括搜索用的关键词（如「骨王」）和结果标题
+    - entries：ssid → 精简条目 {ssid, media_id, title, subtitle, season_type_name}
+    """
+
+    def __init__(self, path: Path):
+        self.path = path
+        self.names: dict[str, list[int]] = {}
+        self.entries: dict[str, dict] = {}
+        self._loaded = False
+
+    def _load(self) -> None:
+        if self._loaded:
+            return
+        self._loaded = True
+        try:
+            data = json.loads(self.path.read_text(encoding="utf-8"))
+            self.names = data.get("names", {})
+            self.entries = data.get("entries", {})
+        except (OSError, ValueError):
+            pass
+
+    def lookup(self, keyword: str) -> list[dict]:
+        self._load()
+        ssids = self.names.get(_normalize(keyword), [])
+        return [self.entries[str(s)] for s in ssids if str(s) in self.entries]
+
+    def learn(self, keyword: str, items: list[dict]) -> None:
+        """记录一次搜索：关键词指向全部结果，每个结果的标题指向其自身。"""
+        self._load()
+        for item in items:
+            self.entries[str(item["ssid"])] = item
+            title = _normalize(item["title"])
+            if title and item["ssid"] not in self.names.setdefault(title, []):
+                self.names[title].append(item["ssid"])
+        key = _normalize(keyword)
+        if key:
+            self.names[key] = [item["ssid"] for item in items]
+        self._save()
+
+    def _save(self) -> None:
+        self.path.parent.mkdir(parents=True, exist_ok=True)
+        tmp = self.path.with_suffix(f".{os.getpid()}.tmp")
+        tmp.write_text(
+            json.dumps({"names": self.names, "entries": self.entries}, ensure_ascii=False),
+            encoding="utf-8",
+        )
+        os.replace(tmp, self.path)
+
+
+_aliases = _AliasIndex(Path(settings.cache_dir) / "bangumi_aliases.json")
+
+
+def _slim(item: dict) -> dict:
+    return {
+        "ssid": item.get("season_id") or item.get("ssid"),
+        "media_id": item.get("media_id"),
+        "title": _strip_html(item.get("title", "未知")),
+        "subtitle": _strip_html(item.get("subtitle", "")),
+        "season_type_name": item.get("season_type_name", ""),
+    }
+
+
+async def _search_remote(keyword: str) -> tuple[list[dict], bool]:
+    """番剧、影视两类并发搜索，按 ssid 去重。返回 (结果, 两类是否都成功)；都失败时抛出异常。"""
+    results = await asyncio.gather(
+        *(
+            gateway.call("search.by_type", partial(
+                search.search_by_type, keyword=keyword, search_type=stype, page=1, page_size=10,
+            ))
+            for stype in (SearchObjectType.BANGUMI, SearchObjectType.FT)
+        ),
+        return_exceptions=True,
+    )
+    errors = [r for r in results if isinstance(r, BaseException)]
+    if len(errors) == len(results):
+        raise errors[0]
+    seen_ssid: set[int] = set()
+    items: list[dict] = []
+    for result in results:
+        if isinstance(result, BaseException):
+            continue
+        for item in result.get("result") or []:
+            slim = _slim(item)
+            if slim["ssid"] and slim["ssid"] not in seen_ssid:
+                seen_ssid.add(slim["ssid"])
+                items.append(slim)
+    return items, not errors
+
+
 @bilibili_agent.tool_plain
-async def search_bangumi_ssid(keyword: str) -> str:
-    """根据番剧/影视名称搜索，返回匹配的 ssid（season_id）、media_id、标题等。同时搜索番剧和影视类型（含剧场版）。"""
+async def search_bangumi_ssid(keyword: str, refresh: bool = False) -> str:
+    """根据番剧/影视名称搜索，返回匹配的 ssid（season_id）、media_id、标题等。同时搜索番剧和影视类型（含剧场版）。
+    搜过的关键词和结果标题会记入本地别名索引，再次查询直接返回；refresh=True 强制重新联网搜索。"""
     try:
-        seen_ssid: set[int] = set()
-        items: list[dict] = []
-        for stype in (SearchObjectType.BANGUMI, SearchObjectType.FT):
-            result = await search.search_by_type(
-                keyword=keyword,
-                search_type=stype,
-                page=1,
-                page_size=10,
-            )
-            for item in result.get("result") or []:
-                sid = item.get("season_id") or item.get("ssid")
-                if sid and sid not in seen_ssid:
-                    seen_ssid.add(sid)
-                    items.append(item)
+        source = ""
+        items: list[dict] | None = None
+        if not refresh:
+            items = _cache.get(_normalize(keyword))
+            if items is None:
+                items = _aliases.lookup(keyword) or None
+                source = "，来自本地别名索引" if items else ""
+        if items is None:
+            items, complete = await _search_remote(keyword)
+            # 只缓存两类都成功的结果，避免把残缺结果固化
+            if items and complete:
+                _cache.set(_normalize(keyword), items)
+                _aliases.learn(keyword, items)
         if not items:
             return f"未找到与「{keyword}」相关的结果。"
         lines: list[str] = []
         for i, item in enumerate(items[:15], 1):
-            ssid = item.get("season_id") or item.get("ssid")
-            media_id = item.get("media_id")
-            title = _strip_html(item.get("title", "未知"))
-            subtitle = _strip_html(item.get("subtitle", ""))
-            season_name = item.get("season_type_name", "")
-            line = f"{i}. {title}"
-            if season_name:
-                line += f"（{season_name}）"
-            elif subtitle:
-                line += f"（{subtitle}）"
-            line += f" — ssid: {ssid}"
-            if media_id:
-                line += f", media_id: {media_id}"
+            line = f"{i}. {item['title']}"
+            if item["season_type_name"]:
+                line += f"（{item['season_type_name']}）"
+            elif item["subtitle"]:
+                line += f"（{item['subtitle']}）"
+            line += f" — ssid: {item['ssid']}"
+            if item["media_id"]:
+                line += f", media_id: {item['media_id']}"
             lines.append(line)
-        return "搜索结果（番剧+影视/剧场版）:\n" + "\n".join(lines)
+        return f"搜索结果（番剧+影视/剧场版{source}）:\n" + "\n".join(lines)
     except Exception as e:
         return f"搜索失败: {e}"
@@ -0,0 +1,155 @@
+"""缓存：内存 LRU（可选 TTL）+ 本地磁盘缓存（gzip JSON，TTL 过期、按总大小淘汰）。"""
+
+import gzip
+import hashlib
+import json
+import os
+import time
+from collections import OrderedDict
+from pathlib import Path
+from typing import Any
+
+from panda_brain.config import settings
+
+_MISSING = object()
+
+
+class LRUCache:
+    """内存 LRU 缓存，超过 maxsize 淘汰最久未用的条目；ttl_sec > 0 时条目按写入时间过期。
+
+    hits / misses 记录 get 的命中与未命中次数。
+    """
+
+    def __init__(self, maxsize: int, ttl_sec: float = 0):
+        self.maxsize = maxsize
+        self.ttl_sec = ttl_sec
+        self.hits = 0
+        self.misses = 0
+        self._data: OrderedDict[str, tuple[float, Any]] = OrderedDict()
+
+    def __len__(self) -> int:
+        return len(self._data)
+
+    def get(self, key: str, default: Any = None) -> Any:
+        entry = self._data.get(key, _MISSING)
+        if entry is not _MISSING:
+            stored_at, value = entry
+            if self.ttl_sec <= 0 or time.monotonic() - stored_at <= self.ttl_sec:
+                self._data.move_to_end(key)
+                self.hits += 1
+                return value
+            del self._data[key]
+        self.misses += 1
+        return default
+
+    def set(self, key: str, value: Any) -> None:
+        self._data[key] = (time.monotonic(), value)
+        self._data.move_to_end(key)
+        while len(self._data) > self.maxsize:
+            self._data.popitem(last=False)
+
+    def delete(self, key: str) -> None:
+        self._data.pop(key, None)
+
+    def clear(self) -> None:
+        self._data.clear()
+
+
+class DiskCache:
+    """命名空间隔离的磁盘缓存。
+
+    - 写入时间记录在文件内容中，超过 ttl_sec 视为过期（ttl_sec <= 0 表示永不过期）
+    - 读取命中会刷新文件 mtime，总大小超过 max_bytes 时按 mtime 从旧到新淘汰（LRU）
+    - 值必须可 JSON 序列化
+    """
+
+    def __init__(self, namespace: str, ttl_sec: float, max_bytes: int):
+        self.dir = Path(settings.cache_dir) / namespace
+        self.ttl_sec = ttl_sec
+        self.max_bytes = max_bytes
+        self._size: int | None = None
+
+    def _path(self, key: str) -> Path:
+        digest = hashlib.sha1(key.encode("utf-8")).hexdigest()
+        return self.dir / digest[:2] / f"{digest}.json.gz"
+
+    def get(self, key: str) -> Any | None:
+        path = self._path(key)
+        try:
+            payload = json.loads(gzip.decompress(path.read_bytes()))
+        except (OSError, ValueError):
+            return None
+        if payload.get("k") != key:
+            return None
+        if self.ttl_sec > 0 and time.time() - payload.get("t", 0) > self.ttl_sec:
+            self._unlink(path)
+            return None
+        try:
+            os.utime(path)
+        except OSError:
+            pass
+        return payload.get("v")
+
+    def set(self, key: str, value: Any) -> None:
+        path = self._path(key)
+        data = gzip.compress(
+            json.dumps(
+                {"k": key, "t": time.time(), "v": value},
+                ensure_ascii=False, separators=(",", ":"),
+            ).encode("utf-8"),
+            compresslevel=6,
+        )
+        try:
+            path.parent.mkdir(parents=True, exist_ok=True)
+            old = path.stat().st_size if path.exists() else 0
+            tmp = path.with_suffix(f".tmp{os.getpid()}")
+            tmp.write_bytes(data)
+            os.replace(tmp, path)
+        except OSError:
+            return
+        if self._size is not None:
+            self._size += len(data) - old
+        self._maybe_evict()
+
+    def delete(self, key: str) -> None:
+        self._unlink(self._path(key))
+
+    def _unlink(self, path: Path) -> None:
+        try:
+            size = path.stat().st_size
+            path.unlink()
+        except OSError:
+            return
+        if self._size is not None:
+            self._size -= size
+
+    def _entries(self) -> list[tuple[float, int, Path]]:
+        entries: list[tuple[float, int, Path]] = []
+        for path in self.dir.glob("*/*.json.gz"):
+            try:
+                st = path.stat()
+            except OSError:
+                continue
+            entries.append((st.st_mtime, st.st_size, path))
+        return entries
+
+    def _maybe_evict(self) -> None:
+        if self.max_bytes <= 0:
+            return
+        if self._size is None:
+            self._size = sum(size for _, size, _ in self._entries())
+        if self._size <= self.max_bytes:
+            return
+        # 淘汰到上限的 90%，避免每次写入都触发全量扫描
+        entries = sorted(self._entries())
+        total = sum(size for _, size, _ in entries)
+        target = int(self.max_bytes * 0.9)
+        for _, size, path in entries:
+            if total <= target:
+                break
+            try:
+                path.unlink()
+            except OSError:
+                continue
+            total -= size
+        self._size = total
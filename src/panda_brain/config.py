@@ -1,3 +1,4 @@
+import httpx
 from pydantic_ai.models.openai import OpenAIChatModel
 from pydantic_ai.providers.ollama import OllamaProvider
 from pydantic_settings import BaseSettings, SettingsConfigDict
@@ -8,14 +9,116 @@ class Settings(BaseSettings):
 
     ollama_base_url: str = "http://localhost:11434/v1"
     default_model: str = "qwen3:latest"
+    # 到 Ollama 的共享连接池：最大连接数 / 保活连接数 / 空闲保活秒数
+    ollama_max_connections: int = 16
+    ollama_max_keepalive: int = 8
+    ollama_keepalive_expiry: float = 120.0
+    # 本地缓存根目录（弹幕分段等）
+    cache_dir: str = ".cache/panda_brain"
+    # 弹幕分段磁盘缓存：开关 / 过期秒数 / 总大小上限（MB）
+    danmaku_cache_enabled: bool = True
+    danmaku_cache_ttl_sec: int = 12 * 3600
+    danmaku_cache_max_mb: int = 512
+    # 弹幕分段并发拉取数 / 单段失败重试次数（经 B 站网关退避重试）
+    danmaku_fetch_concurrency: int = 4
+    danmaku_fetch_retries: int = 3
+    # B 站接口网关：每秒请求数 / 突发上限 / 同时在途请求数 / 限流与网络错误重试次数
+    bilibili_rate_per_sec: float = 5.0
+    bilibili_burst: int = 10
+    bilibili_max_concurrency: int = 4
+    bilibili_retries: int = 3
+    # 番剧分集（已完结）与 epid→bvid 缓存过期秒数 / 连载中季度分集列表的缓存秒数
+    bangumi_cache_ttl_sec: int = 7 * 24 * 3600
+    bangumi_airing_cache_ttl_sec: int = 3600
+    # 高赞评论按 bvid 缓存的秒数（评论工具与弹幕分析共用）
+    comment_cache_ttl_sec: int = 600
+    # 番剧搜索结果缓存过期秒数（别名索引另存，不过期）
+    search_cache_ttl_sec: int = 24 * 3600
+    # LLM 生成结果缓存（按 模型+prompt 哈希）：开关 / 内存条数 / 是否落盘 / 磁盘过期秒数 / 磁盘上限（MB）
+    llm_cache_enabled: bool = True
+    llm_cache_size: int = 4096
+    llm_cache_persist: bool = True
+    llm_cache_ttl_sec: int = 30 * 24 * 3600
+    llm_cache_max_mb: int = 64
+    # 一句话概括的流式生成：最多生成的 token 数 / 是否保留模型的 <think> 推理（关闭可省大量 token）
+    llm_num_predict: int = 160
+    llm_think: bool = False
+    # 委托结果缓存秒数（按 agent + 任务文本），0 表示不缓存；代码专家会执行命令，默认不缓存
+    delegate_cache_ttl_coder: int = 0
+    delegate_cache_ttl_network: int = 60
+    delegate_cache_ttl_bilibili: int = 1800
+    # delegate_parallel：单个子任务超时秒数 / 一次扇出内所有子 agent 合计的模型请求数上限
+    delegate_timeout_sec: float = 300
+    delegate_parallel_request_limit: int = 60
+    # 对话历史的 token 预算（超出时截断较早的工具返回、丢弃最早的轮次）/ 原样保留的最近轮数
+    history_token_budget: int = 6000
+    history_keep_turns: int = 2
+    # HTTP 服务（panda-brain-server）：同时运行的请求数 / 排队上限（超出返回 503）/ 会话数上限 / 会话闲置过期秒数
+    server_max_concurrent_runs: int = 4
+    server_max_queue: int = 16
+    server_max_sessions: int = 256
+    server_session_ttl_sec: int = 3600
+    # 弹幕分析增量重跑：上次完整结果中窗口内容指纹相似度不低于阈值时沿用其概括
+    danmaku_incremental: bool = True
+    danmaku_reuse_similarity: float = 0.8
+    # 后台任务（如整集弹幕分析）同时运行数 / 保留的已结束任务数
+    job_concurrency: int = 1
+    job_history_max: int = 100
+    # 弹幕分析时同时进行的窗口概括数（需配合 Ollama 的 OLLAMA_NUM_PARALLEL）
+    danmaku_llm_concurrency: int = 4
+    # 滑动窗口模式下每次请求打包的窗口数，> 1 时用 JSON 结构化输出一次概括多个窗口
+    danmaku_batch_windows: int = 1
 
 
 settings = Settings()
 
+_http_client: httpx.AsyncClient | None = None
+
+
+def get_http_client() -> httpx.AsyncClient:
+    """进程内共享的 Ollama HTTP 连接池（keep-alive），模型 provider 与直连调用共用。"""
+    global _http_client
+    if _http_client is None or _http_client.is_closed:
+        _http_client = httpx.AsyncClient(
+            limits=httpx.Limits(
+                max_connections=settings.ollama_max_connections,
+                max_keepalive_connections=settings.ollama_max_keepalive,
+                keepalive_expiry=settings.ollama_keepalive_expiry,
+            ),
+            timeout=httpx.Timeout(600, connect=10),
+        )
+    return _http_client
+
+
+async def aclose_http_client() -> None:
+    """关闭共享连接池，进程退出前调用。"""
+    global _http_client
+    if _http_client is not None and not _http_client.is_closed:
+        await _http_client.aclose()
+    _http_client = None
+
+
+_provider: OllamaProvider | None = None
+_provider_client: httpx.AsyncClient | None = None
+_models: dict[str, OpenAIChatModel] = {}
+
+
+def get_provider() -> OllamaProvider:
+    """进程内共享的 Ollama provider；连接池被关闭重建后随之重建。"""
+    global _provider, _provider_client
+    client = get_http_client()
+    if _provider is None or _provider_client is not client:
+        _provider = OllamaProvider(base_url=settings.ollama_base_url, http_client=client)
+        _provider_client = client
+        _models.clear()
+    return _provider
+
 
 def get_model(model_name: str | None = None) -> OpenAIChatModel:
-    """创建 Ollama 模型实例。"""
-    return OpenAIChatModel(
-        model_name=model_name or settings.default_model,
-        provider=OllamaProvider(base_url=settings.ollama_base_url),
-    )
+    """Ollama 模型实例，同名模型各 agent 共用一个。"""
+    model_name = model_name or settings.default_model
+    provider = get_provider()
+    model = _models.get(model_name)
+    if model is None:
+        model = _models[model_name] = OpenAIChatModel(model_name=model_name, provider=provider)
+    return model
@@ -0,0 +1,115 @@
+"""对话历史压缩：按 token 预算裁剪，保持每轮请求的输入量稳定。
+
+超出预算时依次：
+1. 较早轮次中的工具返回截断为摘要长度，较长的回复文本同样截断（最近几轮原样保留）
+2. 仍超出则从最早的轮次开始整轮丢弃，系统提示词并入保留下来的第一条请求
+3. 最近几轮本身仍超出时，除最后一轮外也一并截断
+
+截断只改内容、丢弃以整轮为单位，工具调用与返回始终成对。
+"""
+
+import re
+from dataclasses import replace
+
+from pydantic_ai.messages import (
+    ModelMessage,
+    ModelRequest,
+    SystemPromptPart,
+    TextPart,
+    ToolReturnPart,
+    UserPromptPart,
+)
+
+from panda_brain.config import settings
+
+# 较早轮次中工具返回 / 回复文本保留的字数
+_OLD_TOOL_RETURN_CHARS = 300
+_OLD_TEXT_CHARS = 800
+
+_CJK_RE = re.compile(r"[\u3000-\u9fff\uff00-\uffef]")
+
+
+def estimate_tokens(text: str) -> int:
+    """粗略估算 token 数：中日文字符约 1 个 token，其余约 4 个字符 1 个 token。"""
+    cjk = len(_CJK_RE.findall(text))
+    return cjk + (len(text) - cjk) // 4 + 1
+
+
+def _part_text(part) -> str:
+    if isinstance(part, ToolReturnPart):
+        return part.model_response_str()
+    content = getattr(part, "content", None)
+    if isinstance(content, str):
+        return content
+    args = getattr(part, "args", None)
+    return args if isinstance(args, str) else str(args or content or "")
+
+
+def history_tokens(messages: list[ModelMessage]) -> int:
+    return sum(estimate_tokens(_part_text(p)) for m in messages for p in m.parts)
+
+
+def _split_turns(messages: list[ModelMessage]) -> list[list[ModelMessage]]:
+    """按用户输入切分轮次：每轮以含 UserPromptPart 的请求开始。"""
+    turns: list[list[ModelMessage]] = []
+    for m in messages:
+        starts = isinstance(m, ModelRequest) and any(isinstance(p, UserPromptPart) for p in m.parts)
+        if starts or not turns:
+            turns.append([])
+        turns[-1].append(m)
+    return turns
+
+
+def _clip(text: str, limit: int) -> str:
+    if len(text) <= limit:
+        return text
+    return text[:limit] + f"…（已截断，原文 {len(text)} 字）"
+
+
+def _shrink(message: ModelMessage) -> ModelMessage:
+    parts = []
+    for p in message.parts:
+        if isinstance(p, ToolReturnPart):
+            text = p.model_response_str()
+            if len(text) > _OLD_TOOL_RETURN_CHARS:
+                p = replace(p, content=_clip(text, _OLD_TOOL_RETURN_CHARS))
+        elif isinstance(p, TextPart) and len(p.content) > _OLD_TEXT_CHARS:
+            p = replace(p, content=_clip(p.content, _OLD_TEXT_CHARS))
+        parts.append(p)
+    return replace(message, parts=parts)
+
+
+def compact_history(
+    messages: list[ModelMessage],
+    budget: int | None = None,
+    keep_turns: int | None = None,
+) -> list[ModelMessage]:
+    """把历史压缩到约 budget 个 token 以内（默认 PANDA_HISTORY_TOKEN_BUDGET），
+    最近 keep_turns 轮（默认 PANDA_HISTORY_KEEP_TURNS）不截断、不丢弃。"""
+    budget = settings.history_token_budget if budget is None else budget
+    keep_turns = settings.history_keep_turns if keep_turns is None else keep_turns
+    if budget <= 0 or history_tokens(messages) <= budget:
+        return messages
+
+    turns = _split_turns(messages)
+    keep_turns = max(1, keep_turns)
+    old, recent = turns[:-keep_turns], turns[-keep_turns:]
+    old = [[_shrink(m) for m in turn] for turn in old]
+
+    system_parts = [
+        p for m in messages[:1] if isinstance(m, ModelRequest)
+        for p in m.parts if isinstance(p, SystemPromptPart)
+    ]
+    while old and history_tokens([m for t in old + recent for m in t]) > budget:
+        old.pop(0)
+    if history_tokens([m for t in recent for m in t]) > budget:
+        # 最近几轮本身就超预算（如整集分析结果）：只有最后一轮原样保留
+        recent = [[_shrink(m) for m in turn] for turn in recent[:-1]] + recent[-1:]
+
+    kept = [m for t in old + recent for m in t]
+    first = kept[0]
+    if system_parts and not any(isinstance(p, SystemPromptPart) for p in first.parts):
+        # 被丢弃的第一轮带着系统提示词，并入现在的第一条请求
+        if isinstance(first, ModelRequest):
+            kept[0] = replace(first, parts=[*system_parts, *first.parts])
+    return kept
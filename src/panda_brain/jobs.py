@@ -0,0 +1,227 @@
+"""后台任务队列：耗时任务（如整集弹幕分析）提交后立即返回任务 ID，在当前事件循环后台执行。
+
+每个任务一个 JSON 文件（cache_dir/jobs/<id>.json），记录参数、状态、进度与结果。
+同时运行的任务数受 PANDA_JOB_CONCURRENCY 限制，排队任务按优先级（大者先）、提交时间依次启动。
+进程退出时仍在运行的任务在下次加载队列时重新排队，其种类注册后即重新启动（弹幕分析
+借助 NDJSON 断点续跑，不会从头再来）。同种类、同参数的任务未结束时，重复提交会合并到已有任务。
+
+任务种类由 register(kind, runner) 注册：runner(params, report) 返回可 JSON 序列化的结果，
+report(done, total) 更新进度。
+"""
+
+import asyncio
+import json
+import os
+import time
+import uuid
+from collections.abc import Awaitable, Callable
+from dataclasses import asdict, dataclass, field
+from pathlib import Path
+from typing import Any
+
+from panda_brain.config import settings
+
+Runner = Callable[[dict, Callable[[int, int], None]], Awaitable[Any]]
+
+# 进度最多每隔这么多秒落盘一次
+_SAVE_INTERVAL_SEC = 1.0
+
+
+@dataclass
+class Job:
+    id: str
+    kind: str
+    params: dict
+    priority: int = 0
+    # queued / running / done / failed / cancelled
+    status: str = "queued"
+    created_at: float = field(default_factory=time.time)
+    started_at: float | None = None
+    finished_at: float | None = None
+    done: int = 0
+    total: int = 0
+    result: Any = None
+    error: str = ""
+
+    @property
+    def finished(self) -> bool:
+        return self.status in ("done", "failed", "cancelled")
+
+    def describe(self) -> str:
+        """一行状态：种类、状态、进度与耗时。"""
+        line = f"任务 {self.id}（{self.kind}）{_STATUS_LABELS.get(self.status, self.status)}"
+        if self.status == "running" and self.total:
+            line += f"，进度 {self.done}/{self.total}"
+        if self.started_at is not None:
+            line += f"，已用 {(self.finished_at or time.time()) - self.started_at:.0f} 秒"
+        if self.error:
+            line += f"：{self.error}"
+        return line
+
+
+_STATUS_LABELS = {
+    "queued": "排队中",
+    "running": "运行中",
+    "done": "已完成",
+    "failed": "失败",
+    "cancelled": "已取消",
+}
+
+
+class JobQueue:
+    def __init__(self, root: Path, concurrency: int, history_max: int = 100):
+        self.root = root
+        self.concurrency = max(1, concurrency)
+        self.history_max = history_max
+        self._jobs: dict[str, Job] = {}
+        self._runners: dict[str, Runner] = {}
+        self._tasks: dict[str, asyncio.Task] = {}
+        self._cancelling: set[str] = set()
+        self._saved_at: dict[str, float] = {}
+        self._load()
+
+    def register(self, kind: str, runner: Runner) -> None:
+        """注册任务种类；在事件循环中注册时，上次退出时中断的同类任务随即重新启动。
+
+        在没有事件循环的线程中注册（如后台导入）时，由之后在事件循环中调用 resume() 启动。
+        """
+        self._runners[kind] = runner
+        try:
+            asyncio.get_running_loop()
+        except RuntimeError:
+            return
+        self._pump()
+
+    def resume(self) -> None:
+        """启动已注册种类中排队的任务（含上次退出时中断的任务）；需在事件循环中调用。"""
+        self._pump()
+
+    def submit(self, kind: str, params: dict, priority: int = 0) -> Job:
+        """提交任务并尝试立即启动；需在事件循环中调用。
+
+        已有同种类、同参数且未结束的任务时不重复提交，直接返回该任务（优先级取两者较大者）。
+        """
+        if kind not in self._runners:
+            raise ValueError(f"未知任务类型: {kind}")
+        for job in self._jobs.values():
+            if job.kind == kind and job.params == params and not job.finished:
+                if priority > job.priority:
+                    job.priority = priority
+                    self._save(job)
+                return job
+        job = Job(id=uuid.uuid4().hex[:12], kind=kind, params=params, priority=priority)
+        self._jobs[job.id] = job
+        self._save(job)
+        self._pump()
+        return job
+
+    def get(self, job_id: str) -> Job | None:
+        self._pump()
+        return self._jobs.get(job_id)
+
+    def jobs(self) -> list[Job]:
+        self._pump()
+        return sorted(self._jobs.values(), key=lambda j: j.created_at)
+
+    def cancel(self, job_id: str) -> Job | None:
+        """取消排队或运行中的任务；已结束的任务原样返回。"""
+        job = self._jobs.get(job_id)
+        if job is None or job.finished:
+            return job
+        task = self._tasks.get(job_id)
+        if task is not None:
+            self._cancelling.add(job_id)
+            task.cancel()
+        else:
+            self._finish(job, "cancelled")
+        return job
+
+    def _pump(self) -> None:
+        """空闲名额够时，按优先级启动排队中的任务。"""
+        queued = sorted(
+            (j for j in self._jobs.values() if j.status == "queued" and j.kind in self._runners),
+            key=lambda j: (-j.priority, j.created_at),
+        )
+        for job in queued:
+            if len(self._tasks) >= self.concurrency:
+                return
+            job.status = "running"
+            job.started_at = time.time()
+            job.done = job.total = 0
+            self._save(job)
+            task = asyncio.ensure_future(self._run(job))
+            self._tasks[job.id] = task
+            task.add_done_callback(lambda t, job_id=job.id: self._on_task_done(job_id, t))
+
+    async def _run(self, job: Job) -> None:
+        def _report(done: int, total: int) -> None:
+            job.done, job.total = done, total
+            if time.monotonic() - self._saved_at.get(job.id, 0) >= _SAVE_INTERVAL_SEC:
+                self._save(job)
+
+        try:
+            result = await self._runners[job.kind](job.params, _report)
+        except asyncio.CancelledError:
+            if job.id not in self._cancelling:
+                raise  # 进程退出：保持 running，下次加载时重新排队
+            self._finish(job, "cancelled")
+        except Exception as e:
+            self._finish(job, "failed", error=str(e) or type(e).__name__)
+        else:
+            self._finish(job, "done", result=result)
+
+    def _on_task_done(self, job_id: str, task: asyncio.Task) -> None:
+        self._tasks.pop(job_id, None)
+        self._cancelling.discard(job_id)
+        if not task.cancelled():  # 被取消只可能是事件循环在关闭，此时不再启动新任务
+            self._pump()
+
+    def _finish(self, job: Job, status: str, result: Any = None, error: str = "") -> None:
+        job.status = status
+        job.finished_at = time.time()
+        job.result = result
+        job.error = error
+        self._save(job)
+        self._prune()
+
+    def _prune(self) -> None:
+        """已结束的任务超过 history_max 个时删除最早的。"""
+        finished = sorted(
+            (j for j in self._jobs.values() if j.finished), key=lambda j: j.finished_at or 0,
+        )
+        for job in finished[: max(0, len(finished) - self.history_max)]:
+            del self._jobs[job.id]
+            self._path(job.id).unlink(missing_ok=True)
+
+    def _path(self, job_id: str) -> Path:
+        return self.root / f"{job_id}.json"
+
+    def _save(self, job: Job) -> None:
+        self.root.mkdir(parents=True, exist_ok=True)
+        path = self._path(job.id)
+        tmp = path.with_suffix(f".tmp{os.getpid()}")
+        tmp.write_text(json.dumps(asdict(job), ensure_ascii=False), encoding="utf-8")
+        os.replace(tmp, path)
+        self._saved_at[job.id] = time.monotonic()
+
+    def _load(self) -> None:
+        for path in self.root.glob("*.json"):
+            try:
+                job = Job(**json.loads(path.read_text(encoding="utf-8")))
+            except (OSError, ValueError, TypeError):
+                continue
+            if job.status == "running":
+                job.status = "queued"
+            self._jobs[job.id] = job
+
+
+_queue: JobQueue | None = None
+
+
+def get_queue() -> JobQueue:
+    global _queue
+    if _queue is None:
+        _queue = JobQueue(
+            Path(settings.cache_dir) / "jobs", settings.job_concurrency, settings.job_history_max,
+        )
+    return _queue
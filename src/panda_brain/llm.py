@@ -0,0 +1,223 @@
+"""直连 Ollama 原生接口（/api/generate）的调用，复用 config 中的共享连接池。
+
+相同 (模型, prompt) 的结果按内容哈希缓存：内存 LRU 为第一层，可选磁盘缓存为第二层。
+generate_sentence 走流式接口，生成满一句即断开连接，只为保留下来的 token 付费。
+"""
+
+import asyncio
+import hashlib
+import json
+import re
+import time
+from collections.abc import Awaitable, Callable
+
+from panda_brain.cache import DiskCache, LRUCache
+from panda_brain.config import get_http_client, settings
+
+_memory_cache = LRUCache(settings.llm_cache_size)
+_disk_cache = DiskCache(
+    "llm",
+    ttl_sec=settings.llm_cache_ttl_sec,
+    max_bytes=settings.llm_cache_max_mb * 1024 * 1024,
+)
+_disk_hits = 0
+# 正在请求中的相同 prompt 共享同一次调用（重叠窗口常并发产生相同 prompt）
+_inflight: dict[str, asyncio.Future[str]] = {}
+# 流式生成统计：请求数 / 首 token 耗时合计 / 生成 token 数 / 生成耗时合计
+_stream_stats = {"requests": 0, "ttft_sec": 0.0, "tokens": 0, "gen_sec": 0.0}
+
+_THINK_RE = re.compile(r"<think>.*?(?:</think>|$)", re.S)
+_SENTENCE_END = "。！？!?\n"
+# 句末标点之前至少要有这么多字，避免在「1.」「啊！」这类开头处截断
+_MIN_SENTENCE_CHARS = 8
+
+
+def ollama_host() -> str:
+    """PANDA_OLLAMA_BASE_URL 去掉 OpenAI 兼容的 /v1 后缀，得到原生接口地址。"""
+    return settings.ollama_base_url.rstrip("/").removesuffix("/v1")
+
+
+def _cache_key(model: str, prompt: str, format: dict | str | None) -> str:
+    raw = f"{model}\0{prompt}"
+    if format is not None:
+        raw += "\0" + json.dumps(format, sort_keys=True, ensure_ascii=False)
+    return hashlib.sha256(raw.encode("utf-8")).hexdigest()
+
+
+def cache_stats() -> dict[str, int]:
+    """生成结果缓存的命中统计：内存命中 / 磁盘命中 / 未命中（实际请求）次数。"""
+    return {
+        "memory_hits": _memory_cache.hits,
+        "disk_hits": _disk_hits,
+        "misses": _memory_cache.misses - _disk_hits,
+    }
+
+
+async def generate(
+    prompt: str,
+    model: str | None = None,
+    timeout: float = 25,
+    cache: bool = True,
+    format: dict | str | None = None,
+    validate: Callable[[str], bool] | None = None,
+) -> str:
+    """非流式单次生成，返回去除首尾空白的回复文本。失败时抛出 httpx 异常。
+
+    format 透传给 Ollama 的结构化输出（"json" 或 JSON Schema），此时回复为 JSON 文本。
+    cache=True 且 PANDA_LLM_CACHE_ENABLED 时先查缓存；只缓存非空结果，
+    传入 validate 时还要求 validate(回复) 为真（如结构化输出能解析），否则下次重新请求。
+    """
+    model = model or settings.default_model
+    return await _cached(
+        _cache_key(model, prompt, format),
+        lambda: _request(model, prompt, timeout, format),
+        cache,
+        validate,
+    )
+
+
+async def generate_sentence(
+    prompt: str,
+    model: str | None = None,
+    timeout: float = 25,
+    cache: bool = True,
+) -> str:
+    """流式生成，得到第一句完整的话即停止，返回该句（不含 <think> 推理内容）。
+
+    生成长度受 PANDA_LLM_NUM_PREDICT 限制；PANDA_LLM_THINK=false 时关闭 qwen3 等模型的推理前缀。
+    缓存与 generate 共用，但键与非流式结果区分开，并包含上述两项设置。失败时抛出 httpx 异常。
+    """
+    model = model or settings.default_model
+    return await _cached(
+        # 与非流式结果区分缓存键；生成长度与推理开关会改变输出，一并计入
+        _cache_key(model, prompt, {
+            "mode": "sentence",
+            "num_predict": settings.llm_num_predict,
+            "think": settings.llm_think,
+        }),
+        lambda: _stream_sentence(model, prompt, timeout),
+        cache,
+    )
+
+
+def stream_stats() -> dict[str, float | int]:
+    """流式生成的平均首 token 耗时（毫秒）与生成速度（token/秒）。"""
+    n = _stream_stats["requests"]
+    gen_sec = _stream_stats["gen_sec"]
+    return {
+        "requests": n,
+        "avg_ttft_ms": round(_stream_stats["ttft_sec"] / n * 1000, 1) if n else 0.0,
+        "tokens": _stream_stats["tokens"],
+        "tokens_per_sec": round(_stream_stats["tokens"] / gen_sec, 1) if gen_sec else 0.0,
+    }
+
+
+async def _cached(
+    key: str,
+    fetch: Callable[[], Awaitable[str]],
+    cache: bool,
+    validate: Callable[[str], bool] | None = None,
+) -> str:
+    """两级缓存 + 相同请求合并；只缓存非空且通过 validate 的结果。"""
+    global _disk_hits
+    if not (cache and settings.llm_cache_enabled):
+        return await fetch()
+
+    text = _memory_cache.get(key)
+    if text is not None:
+        return text
+    if settings.llm_cache_persist:
+        text = _disk_cache.get(key)
+        if text is not None:
+            _disk_hits += 1
+            _memory_cache.set(key, text)
+            return text
+
+    pending = _inflight.get(key)
+    if pending is not None:
+        return await asyncio.shield(pending)
+    future: asyncio.Future[str] = asyncio.ensure_future(fetch())
+    _inflight[key] = future
+    try:
+        text = await asyncio.shield(future)
+    finally:
+        if future.done():
+            _inflight.pop(key, None)
+        else:
+            future.add_done_callback(lambda _: _inflight.pop(key, None))
+
+    if text and (validate is None or validate(text)):
+        _memory_cache.set(key, text)
+        if settings.llm_cache_persist:
+            _disk_cache.set(key, text)
+    return text
+
+
+async def _request(
+    model: str, prompt: str, timeout: float, format: dict | str | None = None,
+) -> str:
+    payload: dict = {
+        "model": model,
+        "prompt": prompt,
+        "stream": False,
+    }
+    if format is not None:
+        payload["format"] = format
+    r = await get_http_client().post(
+        f"{ollama_host()}/api/generate",
+        json=payload,
+        timeout=timeout,
+    )
+    r.raise_for_status()
+    return (r.json().get("response") or "").strip()
+
+
+def _first_sentence(raw: str) -> tuple[str, bool]:
+    """去掉 <think> 块（含未闭合的），返回 (可见文本, 是否已有一句完整的话)。"""
+    visible = _THINK_RE.sub("", raw).lstrip()
+    for i, ch in enumerate(visible):
+        if ch in _SENTENCE_END and i >= _MIN_SENTENCE_CHARS:
+            return visible[: i + 1].strip(), True
+    return visible.strip(), False
+
+
+async def _stream_sentence(model: str, prompt: str, timeout: float) -> str:
+    payload: dict = {
+        "model": model,
+        "prompt": prompt,
+        "stream": True,
+        # 不用服务端 stop 序列：它同样会匹配推理前缀里的换行/句号，句末判断放在客户端
+        "options": {"num_predict": settings.llm_num_predict},
+    }
+    if not settings.llm_think:
+        payload["think"] = False
+    raw, text = "", ""
+    tokens = 0
+    started = time.perf_counter()
+    first_at: float | None = None
+    async with get_http_client().stream(
+        "POST", f"{ollama_host()}/api/generate", json=payload, timeout=timeout,
+    ) as r:
+        r.raise_for_status()
+        async for line in r.aiter_lines():
+            if not line:
+                continue
+            chunk = json.loads(line)
+            piece = chunk.get("response") or ""
+            if piece:
+                tokens += 1
+                if first_at is None:
+                    first_at = time.perf_counter()
+                raw += piece
+                text, complete = _first_sentence(raw)
+                if complete:
+                    break
+            if chunk.get("done"):
+                break
+    # 提前 break 时退出 async with 即关闭连接，Ollama 随之停止生成
+    if first_at is not None:
+        _stream_stats["requests"] += 1
+        _stream_stats["ttft_sec"] += first_at - started
+        _stream_stats["tokens"] += tokens
+        _stream_stats["gen_sec"] += time.perf_counter() - first_at
+    return text
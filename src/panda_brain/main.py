@@ -1,42 +1,145 @@
+import argparse
 import asyncio
+import re
+import subprocess
+import sys
+import threading
+from types import ModuleType
+from typing import TYPE_CHECKING
 
-from pydantic_ai.messages import ModelMessage
+if TYPE_CHECKING:
+    from pydantic_ai.messages import ModelMessage
 
-from panda_brain.orchestrator import orchestrator
+# --import-report 依次导入并计时的模块：启动入口、编排器、各子 agent（按需加载的部分）
+_REPORT_TARGETS = [
+    "panda_brain.main",
+    "panda_brain.orchestrator",
+    "panda_brain.agents.coder",
+    "panda_brain.agents.network",
+    "panda_brain.agents.bilibili",
+]
+
+
+def _load_runtime() -> ModuleType:
+    """导入编排器（pydantic_ai、openai 等依赖，耗时 1~2 秒），在后台线程执行。
+
+    子 agent 不在此导入，首次委托时才加载。
+    """
+    import panda_brain.history
+    import panda_brain.orchestrator.tools
+
+    return panda_brain.orchestrator.tools
+
+
+async def _ainput(prompt: str) -> str:
+    """在守护线程中读取输入，等待期间事件循环照常运行（后台任务继续执行）。
+
+    不用默认线程池：退出时阻塞在 input() 的线程会拖住解释器关闭。
+    """
+    loop = asyncio.get_running_loop()
+    future: asyncio.Future[str] = loop.create_future()
+
+    def _read() -> None:
+        try:
+            line = input(prompt)
+        except BaseException as e:  # EOFError / KeyboardInterrupt 交给调用方处理
+            loop.call_soon_threadsafe(lambda e=e: future.done() or future.set_exception(e))
+        else:
+            loop.call_soon_threadsafe(lambda: future.done() or future.set_result(line))
+
+    threading.Thread(target=_read, daemon=True).start()
+    return await future
 
 
 async def main():
     print("🐼 Panda Brain 已启动")
-    print("输入 'quit' 或 'exit' 退出\n")
+    print("输入 'quit' 或 'exit' 退出，'/stats' 查看委托缓存命中情况\n")
 
-    message_history: list[ModelMessage] = []
+    # 提示符先出现，编排器在用户输入期间于后台导入
+    runtime = asyncio.get_running_loop().run_in_executor(None, _load_runtime)
+    message_history: list["ModelMessage"] = []
 
-    while True:
-        try:
-            user_input = input("你: ").strip()
-        except (KeyboardInterrupt, EOFError):
-            print("\n再见!")
-            break
+    try:
+        while True:
+            try:
+                user_input = (await _ainput("你: ")).strip()
+            except (KeyboardInterrupt, EOFError, asyncio.CancelledError):
+                print("\n再见!")
+                break
 
-        if not user_input:
-            continue
-        if user_input.lower() in ("quit", "exit"):
-            print("再见!")
-            break
+            if not user_input:
+                continue
+            if user_input.lower() in ("quit", "exit"):
+                print("再见!")
+                break
 
-        try:
-            result = await orchestrator.run(
-                user_input,
-                message_history=message_history,
-            )
-            print(f"\nPanda: {result.output}\n")
-            message_history = result.all_messages()
-        except Exception as e:
-            print(f"\n错误: {e}\n")
+            tools = await runtime
+            if user_input == "/stats":
+                print(f"\n委托缓存: {tools.delegate_cache_stats()}\n")
+                continue
+
+            from panda_brain import streaming
+
+            streaming.status_sink.set(streaming.status)
+            streaming.begin_stream("Panda: ")
+            try:
+                result = await tools.orchestrator.run(
+                    user_input,
+                    message_history=message_history,
+                    event_stream_handler=streaming.print_stream,
+                )
+                if not streaming.end_stream():
+                    print(result.output)
+                print()
+                message_history = result.all_messages()
+            except Exception as e:
+                streaming.end_stream()
+                print(f"\n错误: {e}\n")
+    finally:
+        if runtime.done() and not runtime.exception():
+            from panda_brain.config import aclose_http_client
+
+            await aclose_http_client()
+
+
+def import_report(top: int = 12) -> None:
+    """在子进程中用 python -X importtime 依次导入 _REPORT_TARGETS，打印各部分新增耗时与最重的依赖。"""
+    proc = subprocess.run(
+        [sys.executable, "-X", "importtime", "-c", "import " + ", ".join(_REPORT_TARGETS)],
+        capture_output=True,
+        text=True,
+    )
+    rows: list[tuple[int, str]] = []
+    for line in proc.stderr.splitlines():
+        m = re.match(r"import time:\s+\d+ \|\s+(\d+) \|( *)(\S+)", line)
+        if m:
+            rows.append((int(m.group(1)), m.group(3)))
+    if proc.returncode != 0 or not rows:
+        print(proc.stderr.strip() or "导入失败")
+        return
+    cumulative = dict((name, us) for us, name in rows)
+    print("各部分导入耗时（按顺序导入，已导入的依赖不重复计时）:")
+    for target in _REPORT_TARGETS:
+        print(f"  {target:<32} {cumulative.get(target, 0) / 1000:8.0f} ms")
+    print(f"\n累计耗时最多的 {top} 个模块（含其依赖）:")
+    heavy = sorted((r for r in rows if r[1] not in _REPORT_TARGETS), reverse=True)[:top]
+    for us, name in heavy:
+        print(f"  {name:<48} {us / 1000:8.0f} ms")
 
 
 def cli():
-    asyncio.run(main())
+    parser = argparse.ArgumentParser(prog="panda-brain", description="Panda Brain 多智能体 CLI")
+    parser.add_argument(
+        "--import-report", action="store_true", help="打印各模块导入耗时后退出，用于排查启动变慢",
+    )
+    args = parser.parse_args()
+    if args.import_report:
+        import_report()
+        return
+    try:
+        asyncio.run(main())
+    except KeyboardInterrupt:
+        pass  # Ctrl-C 打断输入时 main 已打印「再见」，asyncio.run 仍会再抛一次
 
 
 if __name__ == "__main__":
@@ -1,12 +1,16 @@
 from pydantic_ai import Agent
 
 from panda_brain.config import get_model
+from panda_brain.history import compact_history
 
 orchestrator = Agent(
     get_model(),
     system_prompt=(
         "你是 Panda Brain，一个智能编排器。\n"
         "根据用户意图选择合适的工具委托给专家处理，简单问题直接回答。\n"
+        "一个请求包含多个互不依赖的子任务时，用 delegate_parallel 一次同时委托。\n"
         "始终用中文回答。"
     ),
+    # 每次请求模型前按 token 预算压缩历史（含同一轮内多次工具调用之间）
+    history_processors=[compact_history],
 )
@@ -1,27 +1,168 @@
-from pydantic_ai import RunContext
+import asyncio
+import importlib
+import re
+from contextvars import ContextVar
+from typing import Literal
 
-from panda_brain.agents.bilibili import bilibili_agent
-from panda_brain.agents.coder import coder_agent
-from panda_brain.agents.network import network_agent
+from pydantic import BaseModel
+from pydantic_ai import Agent, RunContext, UsageLimits
+from pydantic_ai.messages import ModelMessage, ToolCallPart
+
+from panda_brain.cache import LRUCache
+from panda_brain.config import settings
+from panda_brain.jobs import get_queue
 from panda_brain.orchestrator.agent import orchestrator
+from panda_brain.streaming import status_sink, tool_status_handler
+
+# 子 agent 按需加载：首次委托时才导入其包（连同 bilibili_api 等重依赖），启动时不导入
+_AGENT_MODULES: dict[str, tuple[str, str]] = {
+    "coder": ("panda_brain.agents.coder", "coder_agent"),
+    "network": ("panda_brain.agents.network", "network_agent"),
+    "bilibili": ("panda_brain.agents.bilibili", "bilibili_agent"),
+}
+# 名称 → 导入任务：首次委托时在工作线程中导入，并发的首次委托共用同一次导入
+_agents: dict[str, asyncio.Future[Agent]] = {}
+
+# 当前对话的标识，委托缓存按 (对话, 任务) 取键，不同对话互不复用。
+# HTTP 服务每个会话各自设置；CLI 进程只有一个对话，用默认值
+conversation_id: ContextVar[str] = ContextVar("conversation_id", default="")
+
+# 委托结果缓存：同一对话中重复委托相同任务时直接返回上次结果。TTL 为 0 的 agent 不缓存
+_delegate_caches: dict[str, LRUCache] = {
+    name: LRUCache(128, ttl_sec=ttl)
+    for name, ttl in (
+        ("coder", settings.delegate_cache_ttl_coder),
+        ("network", settings.delegate_cache_ttl_network),
+        ("bilibili", settings.delegate_cache_ttl_bilibili),
+    )
+    if ttl > 0
+}
+
+
+def _import_agent(name: str) -> Agent:
+    module_name, attr = _AGENT_MODULES[name]
+    return getattr(importlib.import_module(module_name), attr)
+
+
+async def _load_agent(name: str) -> Agent:
+    agent = await asyncio.to_thread(_import_agent, name)
+    # 子 agent 导入时在工作线程中注册的后台任务种类，回到事件循环后启动其排队任务
+    get_queue().resume()
+    return agent
+
+
+async def get_agent(name: str) -> Agent:
+    """按名称取子 agent，首次调用时在工作线程中导入，不阻塞事件循环上的其他会话。"""
+    future = _agents.get(name)
+    # 导入失败时下次委托重试，成功的导入结果一直复用
+    if future is None or (future.done() and (future.cancelled() or future.exception() is not None)):
+        future = _agents[name] = asyncio.ensure_future(_load_agent(name))
+    return await asyncio.shield(future)
+
+# 调用过这些工具的委托结果不缓存：任务状态随时间变化，缓存会让轮询一直拿到旧进度
+_UNCACHEABLE_TOOLS = frozenset({
+    "submit_danmaku_analysis", "get_job_status", "get_job_result", "cancel_job",
+})
+
+
+def _normalize_task(task: str) -> str:
+    """任务归一化：合并空白、小写、去掉句末标点。"""
+    return re.sub(r"\s+", " ", task).strip().lower().rstrip("。.!！?？")
+
+
+def _called_uncacheable(messages: list[ModelMessage]) -> bool:
+    return any(
+        isinstance(p, ToolCallPart) and p.tool_name in _UNCACHEABLE_TOOLS
+        for m in messages for p in m.parts
+    )
+
+
+def delegate_cache_stats() -> dict[str, dict[str, int] | None]:
+    """各 agent 委托缓存的命中 / 未命中次数；未启用缓存的 agent 为 None。"""
+    stats: dict[str, dict[str, int] | None] = {}
+    for name in _AGENT_MODULES:
+        c = _delegate_caches.get(name)
+        stats[name] = {"hits": c.hits, "misses": c.misses, "size": len(c)} if c is not None else None
+    return stats
+
+
+async def _delegate(
+    name: str, ctx: RunContext, task: str, usage_limits: UsageLimits | None = None,
+) -> str:
+    cache = _delegate_caches.get(name)
+    key = f"{conversation_id.get()}\0{_normalize_task(task)}"
+    if cache is not None:
+        output = cache.get(key)
+        if output is not None:
+            return output
+    agent = await get_agent(name)
+    result = await agent.run(
+        task,
+        usage=ctx.usage,
+        usage_limits=usage_limits,
+        # 调用方设置了状态输出（CLI / HTTP 流式响应）时，子 agent 内的工具调用也输出开始 / 结束
+        event_stream_handler=tool_status_handler if status_sink.get() is not None else None,
+    )
+    if cache is not None and not _called_uncacheable(result.new_messages()):
+        cache.set(key, result.output)
+    return result.output
 
 
 @orchestrator.tool
 async def delegate_to_coder(ctx: RunContext, task: str) -> str:
     """将编程、代码生成、代码分析、Shell 命令等技术任务委托给代码专家 Agent。"""
-    result = await coder_agent.run(task, usage=ctx.usage)
-    return result.output
+    return await _delegate("coder", ctx, task)
 
 
 @orchestrator.tool
 async def delegate_to_network(ctx: RunContext, task: str) -> str:
     """将网络信息查询任务（如查看 IP 地址）委托给网络诊断专家 Agent。"""
-    result = await network_agent.run(task, usage=ctx.usage)
-    return result.output
+    return await _delegate("network", ctx, task)
 
 
 @orchestrator.tool
 async def delegate_to_bilibili(ctx: RunContext, task: str) -> str:
     """将 B 站相关任务（番剧查询、播放链接获取等）委托给 B 站专家 Agent。"""
-    result = await bilibili_agent.run(task, usage=ctx.usage)
-    return result.output
+    return await _delegate("bilibili", ctx, task)
+
+
+class DelegationTask(BaseModel):
+    agent: Literal["coder", "network", "bilibili"]
+    task: str
+
+
+@orchestrator.tool
+async def delegate_parallel(ctx: RunContext, tasks: list[DelegationTask]) -> str:
+    """把用户请求中彼此独立的多个子任务同时委托给对应专家（coder / network / bilibili），
+    总耗时取决于最慢的一个。例如「查一下我的 IP，再找 OVERLORD 的 ssid」拆成 network 与 bilibili 两个任务。
+    有先后依赖的任务不要放在一起。每个任务单独超时，部分失败时其余结果照常返回。"""
+    if not tasks:
+        return "错误：tasks 为空。"
+    # 所有分支共用 ctx.usage，请求数上限按本次扇出整体计算
+    limits = UsageLimits(
+        request_limit=ctx.usage.requests + settings.delegate_parallel_request_limit,
+    )
+
+    async def _run(t: DelegationTask) -> str:
+        return await asyncio.wait_for(
+            _delegate(t.agent, ctx, t.task, usage_limits=limits),
+            timeout=settings.delegate_timeout_sec,
+        )
+
+    results = await asyncio.gather(*(_run(t) for t in tasks), return_exceptions=True)
+    lines: list[str] = []
+    failed = 0
+    for i, (t, r) in enumerate(zip(tasks, results), 1):
+        if isinstance(r, asyncio.TimeoutError):
+            failed += 1
+            body = f"失败：超过 {settings.delegate_timeout_sec} 秒未完成"
+        elif isinstance(r, BaseException):
+            failed += 1
+            body = f"失败：{r}"
+        else:
+            body = r
+        lines.append(f"【任务{i}·{t.agent}】{t.task}\n{body}")
+    head = f"共 {len(tasks)} 个任务，成功 {len(tasks) - failed} 个"
+    if failed:
+        head += f"，失败 {failed} 个"
+    return head + "\n\n" + "\n\n".join(lines)
@@ -0,0 +1,366 @@
+"""多会话 HTTP 服务（纯 ASGI，不依赖 Web 框架；panda-brain-server 用 uvicorn 启动）。
+
+接口：
+    POST   /sessions                     新建会话 → {"session_id"}
+    POST   /sessions/{id}/messages       {"message": "...", "stream": true}
+                                         stream=true 时返回 SSE：text（文本增量）/ status（工具状态）/
+                                         done（完整回复）/ error 事件；否则返回 {"output"}
+    DELETE /sessions/{id}                删除会话
+    GET    /health                       运行中 / 排队中的请求数、会话数与缓存统计
+
+所有会话共用进程内的 Ollama 连接池、模型实例与各级缓存。同时运行的请求数受
+PANDA_SERVER_MAX_CONCURRENT_RUNS 限制，排队超过 PANDA_SERVER_MAX_QUEUE 时返回 503；
+同一会话的请求依次执行，以保证历史顺序。
+"""
+
+import argparse
+import asyncio
+import json
+import re
+import time
+import uuid
+from collections import OrderedDict
+from collections.abc import AsyncIterable, Awaitable, Callable
+from dataclasses import dataclass, field
+
+from pydantic_ai import RunContext
+from pydantic_ai.messages import AgentStreamEvent, ModelMessage
+
+from panda_brain import streaming
+from panda_brain.config import aclose_http_client, settings
+from panda_brain.llm import cache_stats
+from panda_brain.orchestrator import orchestrator
+from panda_brain.orchestrator.tools import conversation_id, delegate_cache_stats
+
+Scope = dict
+Receive = Callable[[], Awaitable[dict]]
+Send = Callable[[dict], Awaitable[None]]
+
+_SESSION_PATH = re.compile(r"^/sessions/([0-9a-f]{32})(/messages)?$")
+
+
+class HTTPError(Exception):
+    def __init__(self, status: int, message: str, headers: list[tuple[bytes, bytes]] | None = None):
+        super().__init__(message)
+        self.status = status
+        self.message = message
+        self.headers = headers or []
+
+
+@dataclass
+class Session:
+    id: str
+    history: list[ModelMessage] = field(default_factory=list)
+    lock: asyncio.Lock = field(default_factory=asyncio.Lock)
+    last_used: float = field(default_factory=time.monotonic)
+
+
+class SessionStore:
+    """会话表：超过 PANDA_SERVER_MAX_SESSIONS 时淘汰最久未用的空闲会话，闲置超过 TTL 的会话过期。"""
+
+    def __init__(self, max_sessions: int, ttl_sec: float):
+        self.max_sessions = max_sessions
+        self.ttl_sec = ttl_sec
+        self._sessions: OrderedDict[str, Session] = OrderedDict()
+
+    def __len__(self) -> int:
+        return len(self._sessions)
+
+    def create(self) -> str:
+        self._expire()
+        while len(self._sessions) >= self.max_sessions:
+            idle = next((sid for sid, s in self._sessions.items() if not s.lock.locked()), None)
+            if idle is None:
+                raise HTTPError(503, "会话数已满，请稍后重试")
+            del self._sessions[idle]
+        sid = uuid.uuid4().hex
+        self._sessions[sid] = Session(sid)
+        return sid
+
+    def get(self, sid: str) -> Session:
+        self._expire()
+        session = self._sessions.get(sid)
+        if session is None:
+            raise HTTPError(404, "会话不存在或已过期")
+        session.last_used = time.monotonic()
+        self._sessions.move_to_end(sid)
+        return session
+
+    def delete(self, sid: str) -> None:
+        if self._sessions.pop(sid, None) is None:
+            raise HTTPError(404, "会话不存在或已过期")
+
+    def _expire(self) -> None:
+        if self.ttl_sec <= 0:
+            return
+        deadline = time.monotonic() - self.ttl_sec
+        for sid in [sid for sid, s in self._sessions.items() if s.last_used < deadline and not s.lock.locked()]:
+            del self._sessions[sid]
+
+
+class RunGate:
+    """全局并发闸门：最多 limit 个请求同时运行，最多 max_queue 个排队，超出直接拒绝。"""
+
+    def __init__(self, limit: int, max_queue: int):
+        self.max_queue = max_queue
+        self.running = 0
+        self.waiting = 0
+        self._sem = asyncio.Semaphore(max(1, limit))
+
+    def reserve(self) -> None:
+        """占一个排队位；队列已满时抛出 503。之后必须调用 run(...)。"""
+        if self._sem.locked() and self.waiting >= self.max_queue:
+            raise HTTPError(503, "服务繁忙，请稍后重试", [(b"retry-after", b"5")])
+        self.waiting += 1
+
+    def cancel_reservation(self) -> None:
+        """放弃 reserve 占的排队位（请求在调用 run 之前就被取消时）。"""
+        self.waiting -= 1
+
+    async def run(self, coro: Awaitable):
+        try:
+            await self._sem.acquire()
+        finally:
+            self.waiting -= 1
+        self.running += 1
+        try:
+            return await coro
+        finally:
+            self.running -= 1
+            self._sem.release()
+
+
+class PandaServer:
+    def __init__(self):
+        self.sessions = SessionStore(settings.server_max_sessions, settings.server_session_ttl_sec)
+        self.gate = RunGate(settings.server_max_concurrent_runs, settings.server_max_queue)
+
+    async def __call__(self, scope: Scope, receive: Receive, send: Send) -> None:
+        if scope["type"] == "lifespan":
+            await self._lifespan(receive, send)
+            return
+        if scope["type"] != "http":
+            return
+        try:
+            await self._route(scope, receive, send)
+        except HTTPError as e:
+            await _send_json(send, e.status, {"error": e.message}, e.headers)
+
+    async def _lifespan(self, receive: Receive, send: Send) -> None:
+        while True:
+            message = await receive()
+            if message["type"] == "lifespan.startup":
+                await send({"type": "lifespan.startup.complete"})
+            elif message["type"] == "lifespan.shutdown":
+                await aclose_http_client()
+                await send({"type": "lifespan.shutdown.complete"})
+                return
+
+    async def _route(self, scope: Scope, receive: Receive, send: Send) -> None:
+        method, path = scope["method"], scope["path"].rstrip("/")
+        if path == "/health" and method == "GET":
+            await _send_json(send, 200, self._health())
+            return
+        if path == "/sessions" and method == "POST":
+            await _send_json(send, 201, {"session_id": self.sessions.create()})
+            return
+        m = _SESSION_PATH.match(path)
+        if m is None:
+            raise HTTPError(404, "not found")
+        sid, is_messages = m.group(1), bool(m.group(2))
+        if not is_messages and method == "DELETE":
+            self.sessions.delete(sid)
+            await _send_json(send, 200, {"deleted": sid})
+            return
+        if is_messages and method == "POST":
+            body = await _read_json(receive)
+            message = body.get("message")
+            if not isinstance(message, str) or not message.strip():
+                raise HTTPError(400, "message 不能为空")
+            session = self.sessions.get(sid)
+            self.gate.reserve()
+            if body.get("stream", True):
+                await self._stream_reply(session, message.strip(), receive, send)
+            else:
+                task = asyncio.ensure_future(self._run(session, message.strip(), None))
+                watcher = _cancel_on_disconnect(task, receive)
+                try:
+                    output = await task
+                except asyncio.CancelledError:
+                    if watcher.done():
+                        return  # 客户端已断开，运行已取消，无需响应
+                    raise
+                except Exception as e:
+                    raise HTTPError(500, str(e)) from e
+                finally:
+                    watcher.cancel()
+                    task.cancel()
+                await _send_json(send, 200, {"output": output})
+            return
+        raise HTTPError(405, "method not allowed")
+
+    async def _run(
+        self,
+        session: Session,
+        message: str,
+        emit: Callable[[dict], None] | None,
+    ) -> str:
+        """先取会话锁、再占全局运行名额，然后运行编排器；emit 非空时逐个推送 text / status 事件。
+
+        同一会话连续发来的请求在会话锁上排队，不占运行名额，不会挤占其他会话。
+        """
+        try:
+            await session.lock.acquire()
+        except BaseException:
+            self.gate.cancel_reservation()
+            raise
+        try:
+            return await self.gate.run(self._orchestrate(session, message, emit))
+        finally:
+            session.lock.release()
+
+    async def _orchestrate(
+        self,
+        session: Session,
+        message: str,
+        emit: Callable[[dict], None] | None,
+    ) -> str:
+        # 委托缓存只在本会话内复用
+        conversation_id.set(session.id)
+        if emit is not None:
+            streaming.status_sink.set(lambda line: emit({"type": "status", "line": line}))
+        result = await orchestrator.run(
+            message,
+            message_history=session.history,
+            event_stream_handler=_event_handler(emit) if emit is not None else None,
+        )
+        session.history = result.all_messages()
+        return result.output
+
+    async def _stream_reply(
+        self, session: Session, message: str, receive: Receive, send: Send,
+    ) -> None:
+        """SSE 响应：运行在后台任务中，事件经队列写出；客户端断开时取消运行。"""
+        queue: asyncio.Queue[dict | None] = asyncio.Queue()
+
+        async def _produce() -> None:
+            try:
+                output = await self._run(session, message, queue.put_nowait)
+                queue.put_nowait({"type": "done", "output": output})
+            except Exception as e:
+                queue.put_nowait({"type": "error", "error": str(e)})
+            finally:
+                queue.put_nowait(None)
+
+        # 先启动任务（reserve 占的排队位由 _run 释放），再开始写响应
+        task = asyncio.ensure_future(_produce())
+        # 客户端断开后 send 静默返回，不会报错，需单独监听 http.disconnect
+        watcher = _cancel_on_disconnect(task, receive)
+        try:
+            await send({
+                "type": "http.response.start",
+                "status": 200,
+                "headers": [
+                    (b"content-type", b"text/event-stream; charset=utf-8"),
+                    (b"cache-control", b"no-cache"),
+                ],
+            })
+            while (event := await queue.get()) is not None:
+                data = json.dumps(event, ensure_ascii=False)
+                await send({
+                    "type": "http.response.body",
+                    "body": f"event: {event['type']}\ndata: {data}\n\n".encode("utf-8"),
+                    "more_body": True,
+                })
+            await send({"type": "http.response.body", "body": b"", "more_body": False})
+        finally:
+            watcher.cancel()
+            if not task.done():
+                task.cancel()
+
+    def _health(self) -> dict:
+        return {
+            "running": self.gate.running,
+            "queued": self.gate.waiting,
+            "sessions": len(self.sessions),
+            "llm_cache": cache_stats(),
+            "delegate_cache": delegate_cache_stats(),
+        }
+
+
+def _event_handler(emit: Callable[[dict], None]):
+    """编排器事件 → SSE 事件：文本增量发 text，工具调用开始 / 结束发 status。"""
+
+    async def handler(ctx: RunContext, events: AsyncIterable[AgentStreamEvent]) -> None:
+        timer = streaming.ToolTimer(lambda line: emit({"type": "status", "line": line}))
+        async for event in events:
+            text = streaming.text_delta(event)
+            if text:
+                emit({"type": "text", "delta": text})
+            elif text is None:
+                timer.handle(event)
+
+    return handler
+
+
+def _cancel_on_disconnect(task: asyncio.Future, receive: Receive) -> asyncio.Task:
+    """后台监听 http.disconnect，客户端断开时取消 task（释放运行名额与会话锁）。
+
+    返回监听任务，响应结束后由调用方取消。
+    """
+
+    async def _watch() -> None:
+        while (await receive())["type"] != "http.disconnect":
+            pass
+        task.cancel()
+
+    return asyncio.ensure_future(_watch())
+
+
+async def _read_json(receive: Receive) -> dict:
+    chunks: list[bytes] = []
+    while True:
+        message = await receive()
+        if message["type"] == "http.disconnect":
+            raise HTTPError(400, "client disconnected")
+        chunks.append(message.get("body", b""))
+        if not message.get("more_body"):
+            break
+    try:
+        body = json.loads(b"".join(chunks) or b"{}")
+    except ValueError:
+        raise HTTPError(400, "请求体不是合法 JSON") from None
+    if not isinstance(body, dict):
+        raise HTTPError(400, "请求体应为 JSON 对象")
+    return body
+
+
+async def _send_json(
+    send: Send, status: int, payload: dict, headers: list[tuple[bytes, bytes]] | None = None,
+) -> None:
+    body = json.dumps(payload, ensure_ascii=False).encode("utf-8")
+    await send({
+        "type": "http.response.start",
+        "status": status,
+        "headers": [(b"content-type", b"application/json; charset=utf-8"), *(headers or [])],
+    })
+    await send({"type": "http.response.body", "body": body})
+
+
+app = PandaServer()
+
+
+def cli():
+    parser = argparse.ArgumentParser(prog="panda-brain-server", description="Panda Brain 多会话 HTTP 服务")
+    parser.add_argument("--host", default="127.0.0.1")
+    parser.add_argument("--port", type=int, default=8000)
+    args = parser.parse_args()
+    try:
+        import uvicorn
+    except ImportError:
+        raise SystemExit("需要 uvicorn：pip install 'panda-brain[server]' 或 pip install uvicorn")
+    uvicorn.run(app, host=args.host, port=args.port)
+
+
+if __name__ == "__main__":
+    cli()
@@ -0,0 +1,114 @@
+"""流式输出：模型文本逐 token 打印，工具调用开始 / 结束时打印状态行。
+
+用法：agent.run(..., event_stream_handler=print_stream)。
+子 agent 内的工具调用经 tool_status_handler 输出状态行，发往 status_sink 中的回调
+（CLI 设为 status 打印到终端，HTTP 服务设为写入该请求的响应流；未设置时不输出）。
+"""
+
+import sys
+import time
+from collections.abc import AsyncIterable, Callable
+from contextvars import ContextVar
+
+from pydantic_ai import RunContext
+from pydantic_ai.messages import (
+    AgentStreamEvent,
+    FunctionToolCallEvent,
+    FunctionToolResultEvent,
+    PartDeltaEvent,
+    PartStartEvent,
+    TextPart,
+    TextPartDelta,
+)
+
+status_sink: ContextVar[Callable[[str], None] | None] = ContextVar("status_sink", default=None)
+# 当前输出行是否停在模型文本中间（状态行需要先换行）/ 本次回复已输出的字数
+_mid_line = False
+_written = 0
+
+
+def _write(text: str) -> None:
+    global _mid_line, _written
+    if not text:
+        return
+    _written += len(text)
+    sys.stdout.write(text)
+    sys.stdout.flush()
+    _mid_line = not text.endswith("\n")
+
+
+def status(line: str) -> None:
+    """打印一行状态（stderr），不打断正在输出的模型文本。"""
+    global _mid_line
+    if _mid_line:
+        sys.stdout.write("\n")
+        sys.stdout.flush()
+        _mid_line = False
+    sys.stderr.write(f"  · {line}\n")
+    sys.stderr.flush()
+
+
+def text_delta(event: AgentStreamEvent) -> str | None:
+    """事件中的模型文本增量；不是文本事件时返回 None。"""
+    if isinstance(event, PartStartEvent) and isinstance(event.part, TextPart):
+        return event.part.content
+    if isinstance(event, PartDeltaEvent) and isinstance(event.delta, TextPartDelta):
+        return event.delta.content_delta
+    return None
+
+
+class ToolTimer:
+    """按 tool_call_id 记录工具名与开始时间，开始 / 结束时经 emit 输出状态行。"""
+
+    def __init__(self, emit: Callable[[str], None], prefix: str = ""):
+        self.emit = emit
+        self.prefix = prefix
+        self.started: dict[str, tuple[str, float]] = {}
+
+    def handle(self, event: AgentStreamEvent) -> None:
+        if isinstance(event, FunctionToolCallEvent):
+            name = event.part.tool_name
+            self.started[event.part.tool_call_id] = (name, time.monotonic())
+            self.emit(f"{self.prefix}{name} 开始…")
+        elif isinstance(event, FunctionToolResultEvent):
+            name, t0 = self.started.pop(event.tool_call_id, ("工具", time.monotonic()))
+            self.emit(f"{self.prefix}{name} 完成（{time.monotonic() - t0:.1f} 秒）")
+
+
+async def print_stream(ctx: RunContext, events: AsyncIterable[AgentStreamEvent]) -> None:
+    """顶层 agent 的事件处理：文本增量直接写到 stdout，工具调用打印状态行。"""
+    timer = ToolTimer(status)
+    async for event in events:
+        text = text_delta(event)
+        if text is not None:
+            _write(text)
+        else:
+            timer.handle(event)
+
+
+async def tool_status_handler(ctx: RunContext, events: AsyncIterable[AgentStreamEvent]) -> None:
+    """子 agent 的事件处理：只输出工具调用状态（子 agent 的文本作为委托结果返回，不直接输出）。"""
+    sink = status_sink.get()
+    timer = ToolTimer(sink, prefix="  ") if sink is not None else None
+    async for event in events:
+        if timer is not None:
+            timer.handle(event)
+
+
+def begin_stream(prefix: str) -> None:
+    """开始一次回复：打印前缀（如「Panda: 」），文本紧随其后输出。"""
+    global _written, _mid_line
+    sys.stdout.write(f"\n{prefix}")
+    sys.stdout.flush()
+    _written = 0
+    _mid_line = True
+
+
+def end_stream() -> bool:
+    """一次回复输出结束后补换行，返回是否输出过文本（未输出时调用方打印最终结果）。"""
+    global _mid_line
+    if _mid_line:
+        sys.stdout.write("\n")
+        sys.stdout.flush()
+    _mid_line = False
+    return _written > 0